@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,8 +47,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings include every other middleware
+    'pos.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Dynamic responses (HTMX partials, JSON feeds); WhiteNoise already serves compressed static files
+    'django.middleware.gzip.GZipMiddleware',
+    # ETag from the content for GET responses without one, and 304 when it matches
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,12 +96,95 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db' / 'db.sqlite3',
+# Configured from the environment:
+#   DB_ENGINE=sqlite (default) or postgres
+#   postgres: DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT,
+#             DB_POOL_MAX_SIZE (psycopg pool per worker, 0 = persistent
+#             connections with DB_CONN_MAX_AGE instead)
+#   sqlite:   DB_SQLITE_PATH (default db/db.sqlite3),
+#             DB_SQLITE_TEST_PATH (test database, default in the temp dir),
+#             DB_SQLITE_TUNED=0 disables the pragmas below
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'fleasodapos'),
+            'USER': os.environ.get('DB_USER', 'fleasodapos'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if DB_POOL_MAX_SIZE:
+        # Pooled connections can't also be persistent (CONN_MAX_AGE must be 0)
+        DATABASES['default']['OPTIONS']['pool'] = {'min_size': 1, 'max_size': DB_POOL_MAX_SIZE, 'timeout': 10}
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_SQLITE_PATH', BASE_DIR / 'db' / 'db.sqlite3'),
+            'OPTIONS': {},
+            # A file rather than the default in-memory database, so tests that
+            # open connections from several threads share it
+            'TEST': {'NAME': os.environ.get(
+                'DB_SQLITE_TEST_PATH', os.path.join(tempfile.gettempdir(), 'fleasodapos-test.sqlite3'),
+            )},
+        }
     }
+    if os.environ.get('DB_SQLITE_TUNED', '1') != '0':
+        DATABASES['default']['OPTIONS'] = {
+            # WAL: readers don't block the writer and vice versa.
+            # synchronous=NORMAL is durable across app crashes in WAL mode.
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=134217728;'
+                'PRAGMA busy_timeout=5000;'
+            ),
+            # Take the write lock at BEGIN: a deferred transaction that reads
+            # then writes fails with "database is locked" instead of waiting
+            'transaction_mode': 'IMMEDIATE',
+        }
+
+
+# Caches
+# 'stats' holds dashboard KPIs and report charts (pos/stats_cache.py). It is
+# file based so every gunicorn worker sees the same entries and the same
+# invalidations; STATS_CACHE_DIR (default: a directory in the system temp dir)
+# must be shared by the workers. STATS_CACHE_BACKEND=locmem keeps it in process
+# (one worker); pos/tests.py switches to it with override_settings.
+STATS_CACHE_DIR = os.environ.get('STATS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fleasodapos-stats'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'stats': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': STATS_CACHE_DIR,
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
 }
+if os.environ.get('STATS_CACHE_BACKEND') == 'locmem':
+    CACHES['stats'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'TIMEOUT': 24 * 60 * 60}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/6.0/topics/http/sessions/#configuring-the-session-engine
+# The cart is stored compactly (product id -> quantity), so it also fits in a
+# signed cookie: SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+# avoids a database write per scan. 'cached_db' needs a cache shared by all
+# workers (not the default per-process LocMemCache).
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
 
 
 # Password validation
@@ -140,3 +231,13 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 # Enable WhiteNoise compression and caching
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+# Request metrics (pos/metrics.py): scraped at /metrics by staff users or
+# with "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Same SQL run this many times in one request is reported as a possible N+1
+METRICS_N_PLUS_ONE_THRESHOLD = 5
+
+# Statement PDFs rendered by `manage.py pdf_worker`
+# Kept next to the database so it lives on the same volume
+PDF_CACHE_DIR = BASE_DIR / 'db' / 'pdf_cache'
@@ -1,5 +1,32 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save, post_delete
+
+
+def ensure_search_index(sender, using='default', **kwargs):
+    from django.db import connections
+    from .search import install_sqlite_index
+    install_sqlite_index(connections[using])
 
 
 class PosConfig(AppConfig):
     name = 'pos'
+
+    def ready(self):
+        from . import catalog, stats_cache, stock
+        from .models import Product, Client, Sale, SaleItem, Payment
+
+        post_migrate.connect(ensure_search_index, sender=self)
+        post_save.connect(catalog.product_saved, sender=Product)
+        post_delete.connect(catalog.product_deleted, sender=Product)
+        post_save.connect(catalog.client_saved, sender=Client)
+        post_delete.connect(catalog.client_deleted, sender=Client)
+        post_save.connect(stock.product_created, sender=Product)
+
+        post_migrate.connect(stats_cache.data_migrated, sender=self)
+        for model, receiver in [
+            (Sale, stats_cache.sale_changed),
+            (SaleItem, stats_cache.sale_item_changed),
+            (Payment, stats_cache.payment_changed),
+        ]:
+            post_save.connect(receiver, sender=model)
+            post_delete.connect(receiver, sender=model)
@@ -0,0 +1,139 @@
+"""
+Support code for `manage.py benchmark` and `manage.py load_test_checkout`.
+
+`temporary_database()` runs the block against a throwaway database with the
+same engine and OPTIONS as settings (SQLite gets a real file so WAL and
+locking behave like production). `generate_dataset()` fills it with a
+reproducible shop: the same seed always gives the same products, clients,
+sales, items and payments, dated backwards from today.
+"""
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, connections
+from django.utils import timezone
+
+from . import catalog, rollups
+from .models import Product, Client, Sale, SaleItem, Payment, StockMovement
+
+WORDS = [
+    'Arroz', 'Azúcar', 'Café', 'Aceite', 'Leche', 'Pan', 'Huevos', 'Jabón', 'Sal', 'Panela',
+    'Fríjol', 'Lenteja', 'Harina', 'Galletas', 'Gaseosa', 'Agua', 'Atún', 'Pasta', 'Chocolate', 'Queso',
+]
+BRANDS = ['Diana', 'Roa', 'Colanta', 'Alpina', 'Zenú', 'Nacional', 'Doria', 'Ramo', 'Quesada', 'Luker']
+NAMES = ['Ana', 'Luis', 'María', 'Jorge', 'Sofía', 'Carlos', 'Lucía', 'Andrés', 'Valentina', 'Camilo']
+SURNAMES = ['Gómez', 'Rodríguez', 'López', 'Martínez', 'García', 'Pérez', 'Sánchez', 'Ramírez', 'Torres', 'Díaz']
+
+
+@contextmanager
+def temporary_database():
+    tmp_dir = None
+    if connection.vendor == 'sqlite':
+        tmp_dir = tempfile.TemporaryDirectory()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_dir.name, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmp_dir:
+            tmp_dir.cleanup()
+
+
+def generate_dataset(seed=1, products=2000, clients=300, days=365, sales_per_day=30, batch_size=2000):
+    """
+    Create a seeded dataset and return its sizes.
+
+    About a third of the sales are on credit; credit clients pay part of
+    their debt every few weeks. Cached balances, daily rollups, the catalog
+    and client change logs and opening stock movements are filled in as
+    the views would (generated sales don't move stock).
+    """
+    rng = random.Random(seed)
+
+    product_rows = Product.objects.bulk_create([
+        Product(
+            name=f'{rng.choice(WORDS)} {rng.choice(BRANDS)} {rng.choice([250, 500, 1000, 2500])}g',
+            barcode=f'77{seed:02d}{i:09d}',
+            price=rng.randrange(500, 50000, 100),
+            stock=rng.randrange(0, 500),
+        )
+        for i in range(products)
+    ], batch_size=batch_size)
+    product_ids = [p.id for p in product_rows]
+    prices = {p.id: p.price for p in product_rows}
+    catalog.record_changes(product_ids)
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=p.id, kind=StockMovement.ADJUSTMENT, quantity=p.stock, note='Stock inicial')
+        for p in product_rows if p.stock
+    ], batch_size=batch_size)
+
+    client_rows = [
+        Client(name=f'{rng.choice(NAMES)} {rng.choice(SURNAMES)} {i}', phone=f'3{rng.randrange(10**9):09d}')
+        for i in range(clients)
+    ]
+    for client in client_rows:
+        client.fill_lookup_keys()
+    client_rows = Client.objects.bulk_create(client_rows, batch_size=batch_size)
+    client_ids = [c.id for c in client_rows]
+    catalog.record_client_changes(client_ids)
+
+    now = timezone.now()
+    balances = dict.fromkeys(client_ids, 0)
+    sale_count = item_count = payment_count = 0
+    for day in range(days, -1, -1):
+        day_start = now - timedelta(days=day)
+        sales = []
+        lines = []
+        for _ in range(rng.randint(sales_per_day // 2, sales_per_day * 3 // 2)):
+            client_id = rng.choice(client_ids)
+            method = 'CREDIT' if rng.random() < 0.35 else 'CASH'
+            quantities = {rng.choice(product_ids): rng.randint(1, 4) for _ in range(rng.randint(1, 6))}
+            total = sum(prices[pid] * qty for pid, qty in quantities.items())
+            sales.append(Sale(
+                client_id=client_id, payment_method=method, total=total, is_paid=(method == 'CASH'),
+                date=day_start - timedelta(minutes=rng.randrange(0, 12 * 60)), note='',
+            ))
+            lines.append(quantities)
+            if method == 'CREDIT':
+                balances[client_id] += total
+        sales = Sale.objects.bulk_create(sales, batch_size=batch_size)
+        items = [
+            SaleItem(sale_id=sale.id, product_id=pid, quantity=qty, price=prices[pid])
+            for sale, quantities in zip(sales, lines)
+            for pid, qty in quantities.items()
+        ]
+        SaleItem.objects.bulk_create(items, batch_size=batch_size)
+
+        payments = []
+        for client_id in rng.sample(client_ids, k=max(1, len(client_ids) // 20)):
+            if balances[client_id] > 0:
+                amount = min(balances[client_id], rng.randrange(1000, 200000, 1000))
+                balances[client_id] -= amount
+                payments.append(Payment(client_id=client_id, amount=amount, note='Abono', date=day_start))
+        payments = Payment.objects.bulk_create(payments, batch_size=batch_size)
+        # Payment.date is auto_now_add, set the generated date afterwards
+        Payment.objects.filter(id__in=[p.id for p in payments]).update(date=day_start)
+
+        sale_count += len(sales)
+        item_count += len(items)
+        payment_count += len(payments)
+
+    for client_id, balance in balances.items():
+        if balance:
+            Client.objects.filter(pk=client_id).update(cached_balance=balance)
+    rollups.rebuild()
+
+    return {
+        'seed': seed,
+        'products': len(product_ids),
+        'clients': len(client_ids),
+        'days': days,
+        'sales': sale_count,
+        'sale_items': item_count,
+        'payments': payment_count,
+    }
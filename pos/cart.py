@@ -0,0 +1,80 @@
+"""
+Session cart, stored compactly as {"<product id>": quantity}.
+
+Names and prices are not copied into the session: rendering the cart reads
+them from the database in one query for all lines, the same prices checkout
+charges (the per-process `product_cache` can lag other workers' edits by up
+to its TTL, so it isn't used for totals). Each mutation changes a single
+entry and only marks the session as modified when something actually
+changed, so a scan writes a few bytes instead of re-serializing every line
+with its product data.
+
+Sessions created before this format ({"<id>": {"id", "name", "price",
+"quantity"}}) are converted the first time they are read.
+"""
+from .models import Product
+
+SESSION_KEY = 'cart'
+
+
+def get_cart(session):
+    """{product_id: quantity} for the session, converting the old format if needed"""
+    cart = session.get(SESSION_KEY) or {}
+    if any(isinstance(qty, dict) for qty in cart.values()):
+        cart = {key: (qty['quantity'] if isinstance(qty, dict) else qty) for key, qty in cart.items()}
+        session[SESSION_KEY] = cart
+    return {int(key): qty for key, qty in cart.items()}
+
+
+def add(session, product_id, quantity=1):
+    get_cart(session)  # normalizes old sessions
+    cart = session.get(SESSION_KEY) or {}
+    key = str(product_id)  # JSON keys are strings
+    current = cart.get(key, 0)
+    updated = max(current + quantity, 0)
+    if updated == current:
+        return
+    if updated:
+        cart[key] = updated
+    else:
+        del cart[key]
+    session[SESSION_KEY] = cart
+
+
+def remove(session, product_id):
+    get_cart(session)
+    cart = session.get(SESSION_KEY) or {}
+    if cart.pop(str(product_id), None) is not None:
+        session.modified = True
+
+
+def clear(session):
+    if session.get(SESSION_KEY):
+        session[SESSION_KEY] = {}
+
+
+def cart_items(session):
+    """(items, total) for display; items are fresh dicts, nothing is written back"""
+    cart = get_cart(session)
+    products = {}
+    if cart:
+        products = {
+            product_id: (name, price)
+            for product_id, name, price in Product.objects.filter(id__in=cart).values_list('id', 'name', 'price')
+        }
+    items = []
+    total = 0
+    for product_id, quantity in cart.items():
+        if product_id not in products:
+            continue  # deleted since it was added; checkout reports it
+        name, price = products[product_id]
+        subtotal = quantity * price
+        total += subtotal
+        items.append({
+            'id': product_id,
+            'name': name,
+            'price': price,
+            'quantity': quantity,
+            'subtotal': subtotal,
+        })
+    return items, total
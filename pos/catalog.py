@@ -0,0 +1,129 @@
+"""
+Product catalog and client list feeds for terminals (`pos/catalog.json`,
+`pos/clients.json`): a full snapshot, or only what changed since a version.
+
+Every product write records a CatalogChange row (see the model): saves and
+deletes through signals connected in apps.py, bulk `.update()` calls (stock
+at checkout) by calling `record_changes` directly. Each writing transaction
+bumps the catalog version (a FeedVersion row, locked until it commits) and
+stamps its changes with it, so a terminal that has version N asks for
+`?since=N` and gets only the products changed or deleted after it, including
+those of transactions that were still open when it read version N.
+
+Clients work the same way with ClientChange rows, recorded by signals on
+Client saves and deletes (balance updates don't touch the feed's fields).
+
+Rows are compact lists in FIELDS order instead of dicts.
+"""
+from django.db import transaction
+
+from .models import Product, Client, CatalogChange, ClientChange, FeedVersion
+
+FIELDS = ['id', 'name', 'barcode', 'price', 'stock']
+FEED = 'products'
+
+CLIENT_FIELDS = ['id', 'name']
+CLIENT_FEED = 'clients'
+
+
+def bump_version(feed):
+    """
+    Next version of `feed`. The counter row stays locked until the caller's
+    transaction ends, so versions are committed in order.
+    """
+    counter, _ = FeedVersion.objects.select_for_update().get_or_create(name=feed)
+    counter.version += 1
+    counter.save(update_fields=['version'])
+    return counter.version
+
+
+def feed_version(feed):
+    return FeedVersion.objects.filter(name=feed).values_list('version', flat=True).first() or 0
+
+
+def _record(change_model, id_field, feed, ids, deleted):
+    ids = set(ids)
+    if not ids:
+        return
+    with transaction.atomic():
+        version = bump_version(feed)
+        change_model.objects.filter(**{f'{id_field}__in': ids}).delete()
+        change_model.objects.bulk_create([
+            change_model(**{id_field: obj_id}, deleted=deleted, version=version) for obj_id in sorted(ids)
+        ])
+
+
+def _snapshot(feed, queryset, fields, key):
+    # Version first: rows changed in between are re-sent by the next delta
+    version = feed_version(feed)
+    return {
+        'version': version,
+        'fields': fields,
+        key: list(queryset.order_by('id').values_list(*fields)),
+    }
+
+
+def _changes_since(change_model, id_field, queryset, fields, key, since):
+    changes = list(change_model.objects.filter(version__gt=since).values_list('version', id_field, 'deleted'))
+    version = max((change_version for change_version, _, _ in changes), default=since)
+    changed_ids = [obj_id for _, obj_id, deleted in changes if not deleted]
+    return {
+        'version': version,
+        'since': since,
+        'fields': fields,
+        key: list(queryset.filter(id__in=changed_ids).order_by('id').values_list(*fields)),
+        'deleted': [obj_id for _, obj_id, deleted in changes if deleted],
+    }
+
+
+def record_changes(product_ids, deleted=False):
+    """Give these products a new version (four queries whatever their number)"""
+    _record(CatalogChange, 'product_id', FEED, product_ids, deleted)
+
+
+def current_version():
+    return feed_version(FEED)
+
+
+def snapshot():
+    """Full catalog: {'version', 'fields', 'products'}"""
+    return _snapshot(FEED, Product.objects.all(), FIELDS, 'products')
+
+
+def changes_since(since):
+    """Products changed after version `since`: {'version', 'since', 'fields', 'products', 'deleted'}"""
+    return _changes_since(CatalogChange, 'product_id', Product.objects.all(), FIELDS, 'products', since)
+
+
+def record_client_changes(client_ids, deleted=False):
+    _record(ClientChange, 'client_id', CLIENT_FEED, client_ids, deleted)
+
+
+def current_client_version():
+    return feed_version(CLIENT_FEED)
+
+
+def client_snapshot():
+    """Full client list: {'version', 'fields', 'clients'}"""
+    return _snapshot(CLIENT_FEED, Client.objects.all(), CLIENT_FIELDS, 'clients')
+
+
+def client_changes_since(since):
+    """Clients changed after version `since`: {'version', 'since', 'fields', 'clients', 'deleted'}"""
+    return _changes_since(ClientChange, 'client_id', Client.objects.all(), CLIENT_FIELDS, 'clients', since)
+
+
+def product_saved(sender, instance, **kwargs):
+    record_changes([instance.pk])
+
+
+def product_deleted(sender, instance, **kwargs):
+    record_changes([instance.pk], deleted=True)
+
+
+def client_saved(sender, instance, **kwargs):
+    record_client_changes([instance.pk])
+
+
+def client_deleted(sender, instance, **kwargs):
+    record_client_changes([instance.pk], deleted=True)
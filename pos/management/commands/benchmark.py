@@ -0,0 +1,200 @@
+import json
+import platform
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client as HttpClient
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from pos import product_cache, search
+from pos.benchmarks import temporary_database, generate_dataset, WORDS, BRANDS
+from pos.models import Product, Client
+
+SCENARIOS = [
+    'search_index', 'search_products', 'add_to_cart', 'checkout', 'client_statement', 'dashboard',
+    'report_analytics',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de las vistas principales sobre una base de datos temporal con datos '
+        'generados (semilla fija): latencia, consultas SQL y throughput, con reporte JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--clients', type=int, default=300)
+        parser.add_argument('--days', type=int, default=365, help='Días de historia de ventas y abonos')
+        parser.add_argument('--sales-per-day', type=int, default=30)
+        parser.add_argument('--workers', type=int, default=4, help='Clientes HTTP concurrentes')
+        parser.add_argument('--requests', type=int, default=200, help='Peticiones por escenario')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Solo estos escenarios (se puede repetir)')
+        parser.add_argument('--output', help='Guardar el reporte JSON en este archivo')
+        parser.add_argument('--compare', help='Reporte JSON anterior para comparar')
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            start = time.perf_counter()
+            dataset = generate_dataset(
+                seed=options['seed'], products=options['products'], clients=options['clients'],
+                days=options['days'], sales_per_day=options['sales_per_day'],
+            )
+            self.stdout.write(
+                f"Datos: {dataset['products']} productos, {dataset['clients']} clientes, "
+                f"{dataset['sales']} ventas, {dataset['payments']} abonos "
+                f"({time.perf_counter() - start:.1f}s)"
+            )
+            product_cache.clear()
+
+            results = {}
+            for name in options['scenario'] or SCENARIOS:
+                results[name] = self.run_scenario(name, options)
+                self.print_result(name, results[name])
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': {
+                'vendor': connection.vendor,
+                'options': {k: str(v) for k, v in settings.DATABASES['default'].get('OPTIONS', {}).items()},
+            },
+            'dataset': dataset,
+            'workers': options['workers'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Reporte en {options['output']}")
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), report)
+
+    def run_scenario(self, name, options):
+        workers = options['workers']
+        per_worker = max(1, options['requests'] // workers)
+        user, _ = User.objects.get_or_create(username='benchmark')
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        client_ids = list(Client.objects.values_list('id', flat=True))
+        samples = []  # (seconds, queries)
+        errors = []
+        lock = threading.Lock()
+
+        def worker(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            http = HttpClient()
+            http.force_login(user)
+            prepare, request = self.scenario(name, http, rng, product_ids, client_ids)
+            db = connections['default']
+            for _ in range(per_worker):
+                prepare()
+                try:
+                    with CaptureQueriesContext(db) as queries:
+                        start = time.perf_counter()
+                        response = request()
+                        elapsed = time.perf_counter() - start
+                    # search_index returns the results, not a response
+                    if getattr(response, 'status_code', 200) >= 400:
+                        raise RuntimeError(f'HTTP {response.status_code}')
+                except Exception as exc:
+                    with lock:
+                        errors.append(f'{type(exc).__name__}: {exc}')
+                    continue
+                with lock:
+                    samples.append((elapsed, len(queries)))
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+
+        latencies = sorted(seconds * 1000 for seconds, _ in samples)
+        query_counts = [count for _, count in samples]
+        if not latencies:
+            return {'requests': 0, 'errors': len(errors), 'first_error': errors[0] if errors else None}
+        return {
+            'requests': len(samples),
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 2),
+            'max_ms': round(latencies[-1], 2),
+            'queries_mean': round(statistics.mean(query_counts), 2),
+            'queries_max': max(query_counts),
+            # Throughput includes untimed setup (filling carts for checkout)
+            'throughput_rps': round(len(samples) / wall, 1),
+        }
+
+    def scenario(self, name, http, rng, product_ids, client_ids):
+        """(prepare, request) callables for one simulated user"""
+        def nothing():
+            pass
+
+        if name == 'search_index':
+            # The index alone, without the HTTP stack: top 20 for a partly typed
+            # name, sometimes with a brand (`--products 100000` for the 10 ms target)
+            def query():
+                terms = [rng.choice(WORDS)[:rng.randint(3, 5)]]
+                if rng.random() < 0.5:
+                    terms.append(rng.choice(BRANDS)[:3])
+                return search.search_products(' '.join(terms), limit=20)
+            return nothing, query
+        if name == 'search_products':
+            return nothing, lambda: http.get('/pos/search/', {'search': rng.choice(WORDS)[:rng.randint(3, 5)]})
+        if name == 'add_to_cart':
+            def add():
+                if rng.random() < 0.1:
+                    http.post('/pos/clear-cart/')
+                return http.post('/pos/add-cart/', {'product_id': rng.choice(product_ids), 'quantity': 1})
+            return nothing, add
+        if name == 'checkout':
+            def fill_cart():
+                for pid in rng.sample(product_ids, 3):
+                    http.post('/pos/add-cart/', {'product_id': pid, 'quantity': rng.randint(1, 3)})
+            return fill_cart, lambda: http.post('/pos/checkout/', {
+                'client_id': rng.choice(client_ids), 'payment_method': rng.choice(['CASH', 'CREDIT']),
+            })
+        if name == 'client_statement':
+            return nothing, lambda: http.get(f'/clients/{rng.choice(client_ids)}/statement/')
+        if name == 'dashboard':
+            return nothing, lambda: http.get('/')
+        if name == 'report_analytics':
+            return nothing, lambda: http.get('/reports/')
+        raise ValueError(name)
+
+    def print_result(self, name, result):
+        if not result['requests']:
+            self.stderr.write(f"{name:>18}: sin respuestas válidas ({result['first_error']})")
+            return
+        self.stdout.write(
+            f"{name:>18}: p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+            f"{result['queries_mean']:5.1f} consultas  {result['throughput_rps']:7.1f} req/s"
+            + (f"  {result['errors']} errores" if result['errors'] else '')
+        )
+
+    def print_comparison(self, before, after):
+        self.stdout.write('Comparación (antes -> ahora):')
+        for name, result in after['results'].items():
+            previous = before.get('results', {}).get(name)
+            if not previous or not previous.get('requests') or not result.get('requests'):
+                continue
+            change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100 if previous['p50_ms'] else 0
+            self.stdout.write(
+                f"{name:>18}: p50 {previous['p50_ms']:.1f} -> {result['p50_ms']:.1f} ms ({change:+.0f}%)  "
+                f"consultas {previous['queries_mean']} -> {result['queries_mean']}  "
+                f"req/s {previous['throughput_rps']} -> {result['throughput_rps']}"
+            )
@@ -0,0 +1,186 @@
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client as HttpClient
+from django.utils import timezone
+
+from pos.benchmarks import temporary_database, generate_dataset, WORDS, NAMES
+
+# gunicorn arguments per setup; 'wsgi' is the previous deployment (sync workers)
+SERVERS = {
+    'wsgi': ['core.wsgi:application'],
+    'asgi': ['--worker-class', 'uvicorn_worker.UvicornWorker', 'core.asgi:application'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara búsquedas HTMX concurrentes (productos y clientes) servidas por gunicorn '
+        'con workers WSGI síncronos y con workers ASGI (uvicorn), sobre una base de datos temporal'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--server-workers', type=int, default=2, help='Procesos de gunicorn')
+        parser.add_argument('--concurrency', type=int, default=32, help='Clientes HTTP simultáneos')
+        parser.add_argument('--requests', type=int, default=2000, help='Peticiones por servidor')
+        parser.add_argument('--server', action='append', choices=list(SERVERS),
+                            help='Solo estos servidores (se puede repetir)')
+        parser.add_argument('--output', help='Guardar el reporte JSON en este archivo')
+
+    def handle(self, *args, **options):
+        results = {}
+        with temporary_database():
+            dataset = generate_dataset(
+                seed=options['seed'], products=options['products'], clients=options['clients'],
+                days=30, sales_per_day=10,
+            )
+            user = User.objects.create_user('benchmark')
+            http = HttpClient()
+            http.force_login(user)
+            cookie = f"sessionid={http.cookies['sessionid'].value}"
+            env = dict(os.environ)
+            if connection.vendor == 'sqlite':
+                env['DB_SQLITE_PATH'] = str(connection.settings_dict['NAME'])
+            else:
+                env['DB_NAME'] = connection.settings_dict['NAME']
+            connections.close_all()
+
+            for name in options['server'] or list(SERVERS):
+                with self.server(name, options['server_workers'], env) as port:
+                    results[name] = self.run_load(port, cookie, options)
+                self.print_result(name, results[name])
+
+        if 'wsgi' in results and 'asgi' in results and results['wsgi']['requests']:
+            ratio = results['asgi']['throughput_rps'] / results['wsgi']['throughput_rps']
+            self.stdout.write(f'ASGI / WSGI: {ratio:.2f}x req/s')
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'created_at': timezone.now().isoformat(),
+                    'python': sys.version.split()[0],
+                    'database': connection.vendor,
+                    'dataset': dataset,
+                    'server_workers': options['server_workers'],
+                    'concurrency': options['concurrency'],
+                    'results': results,
+                }, f, indent=2)
+            self.stdout.write(f"Reporte en {options['output']}")
+
+    @contextmanager
+    def server(self, name, workers, env):
+        """Run gunicorn with the `name` setup on a free port until the block ends"""
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+             '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', *SERVERS[name]],
+            env=env,
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                if process.poll() is not None:
+                    raise CommandError(f'{name}: gunicorn terminó al iniciar (¿están instalados gunicorn y uvicorn-worker?)')
+                if time.monotonic() > deadline:
+                    raise CommandError(f'{name}: el servidor no respondió')
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.2)
+            yield port
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def run_load(self, port, cookie, options):
+        concurrency = options['concurrency']
+        per_client = max(1, options['requests'] // concurrency)
+        headers = {'Cookie': cookie, 'HX-Request': 'true'}
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def paths(rng):
+            # Prefixes as typed: half product searches, half client lookups
+            while True:
+                if rng.random() < 0.5:
+                    yield '/pos/search/?' + urlencode({'search': rng.choice(WORDS)[:rng.randint(2, 5)]})
+                else:
+                    yield '/clients/search/?' + urlencode({'search': rng.choice(NAMES)[:rng.randint(2, 4)]})
+
+        def client(index, count, record):
+            rng = random.Random(options['seed'] * 1000 + index)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            requests = paths(rng)
+            for _ in range(count):
+                path = next(requests)
+                start = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        raise RuntimeError(f'HTTP {response.status}')
+                except Exception as exc:
+                    conn.close()
+                    if record:
+                        with lock:
+                            errors.append(f'{type(exc).__name__}: {exc}')
+                    continue
+                if record:
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+            conn.close()
+
+        def run(count, record):
+            threads = [threading.Thread(target=client, args=(i, count, record)) for i in range(concurrency)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return time.perf_counter() - start
+
+        run(2, record=False)  # warm up every worker
+        wall = run(per_client, record=True)
+        latencies = sorted(seconds * 1000 for seconds in latencies)
+        result = {'requests': len(latencies), 'errors': len(errors), 'first_error': errors[0] if errors else None}
+        if latencies:
+            result.update({
+                'p50_ms': round(statistics.median(latencies), 2),
+                'p95_ms': round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 2),
+                'p99_ms': round(latencies[max(0, int(len(latencies) * 0.99) - 1)], 2),
+                'throughput_rps': round(len(latencies) / wall, 1),
+            })
+        return result
+
+    def print_result(self, name, result):
+        if not result['requests']:
+            self.stderr.write(f"{name}: sin respuestas válidas ({result['first_error']})")
+            return
+        self.stdout.write(
+            f"{name}: {result['throughput_rps']:7.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+            f"p95 {result['p95_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms"
+            + (f"  {result['errors']} errores" if result['errors'] else '')
+        )
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos import product_import
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa o actualiza productos desde un CSV de proveedor (columnas codigo, nombre, '
+        'precio, stock), por lotes y usando el código de barras como llave'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo CSV')
+        parser.add_argument('--encoding', default='utf-8-sig', help='Codificación del archivo (p. ej. latin-1)')
+        parser.add_argument('--chunk-size', type=int, default=product_import.CHUNK_SIZE,
+                            help='Filas por transacción')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as f:
+                result = product_import.import_products(f, chunk_size=options['chunk_size'])
+        except (OSError, UnicodeDecodeError, product_import.ImportFileError) as exc:
+            raise CommandError(str(exc))
+
+        for line, message in result['errors']:
+            self.stderr.write(f'Línea {line}: {message}')
+        if result['error_count'] > len(result['errors']):
+            self.stderr.write(f"... y {result['error_count'] - len(result['errors'])} errores más")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['rows']} filas en {time.perf_counter() - start:.1f}s: "
+            f"{result['created']} creados, {result['updated']} actualizados, {result['error_count']} con error"
+        ))
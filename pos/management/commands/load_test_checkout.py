@@ -0,0 +1,97 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client as HttpClient
+
+from pos.benchmarks import temporary_database
+from pos.models import Product, Client, Sale
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga: cobros concurrentes (agregar al carrito + checkout) '
+        'contra una base de datos temporal con la configuración actual'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Cajas simultáneas (hilos)')
+        parser.add_argument('--sales', type=int, default=50, help='Ventas por caja')
+        parser.add_argument('--items', type=int, default=3, help='Productos por venta')
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            self.run_load(options)
+
+    def run_load(self, options):
+        workers, sales, items = options['workers'], options['sales'], options['items']
+        user = User.objects.create_user('carga', password='carga')
+        customer = Client.objects.create(name='Cliente Carga')
+        products = Product.objects.bulk_create([
+            Product(name=f'Producto Carga {i}', price=1000 + i, stock=1_000_000) for i in range(50)
+        ])
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def register(worker):
+            http = HttpClient()
+            http.force_login(user)
+            for n in range(sales):
+                start = time.perf_counter()
+                try:
+                    for i in range(items):
+                        product = products[(worker * 7 + n + i) % len(products)]
+                        http.post('/pos/add-cart/', {'product_id': product.id, 'quantity': 1})
+                    response = http.post('/pos/checkout/', {'client_id': customer.id, 'payment_method': 'CREDIT'})
+                    if response.status_code != 302:
+                        raise RuntimeError(f'checkout {response.status_code}')
+                except Exception as exc:
+                    with lock:
+                        errors.append(f'{type(exc).__name__}: {exc}')
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            connections.close_all()
+
+        threads = [threading.Thread(target=register, args=(w,)) for w in range(workers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f'Motor: {connection.vendor} {self.describe_connection()}')
+        self.stdout.write(f'{workers} cajas x {sales} ventas x {items} productos')
+        self.stdout.write(f'Ventas registradas: {Sale.objects.count()} en {elapsed:.2f}s '
+                          f'({len(latencies) / elapsed:.1f} ventas/s)')
+        if latencies:
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+            self.stdout.write(f'Latencia por venta: p50 {statistics.median(latencies) * 1000:.0f} ms, '
+                              f'p95 {p95 * 1000:.0f} ms')
+        customer.refresh_from_db()
+        expected = Sale.objects.filter(client=customer).values_list('total', flat=True)
+        if customer.cached_balance != sum(expected):
+            self.stderr.write('El saldo del cliente no coincide con sus ventas')
+        if errors:
+            self.stderr.write(f'{len(errors)} ventas fallidas, p. ej.: {errors[0]}')
+        else:
+            self.stdout.write(self.style.SUCCESS('Sin errores'))
+
+    def describe_connection(self):
+        if connection.vendor != 'sqlite':
+            options = connection.settings_dict['OPTIONS']
+            return f"(pool={options.get('pool', False)}, CONN_MAX_AGE={connection.settings_dict['CONN_MAX_AGE']})"
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+        mode = connection.settings_dict['OPTIONS'].get('transaction_mode') or 'DEFERRED'
+        return f'(journal_mode={journal}, synchronous={synchronous}, BEGIN {mode})'
@@ -0,0 +1,76 @@
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+from django.utils import timezone
+
+from pos.models import Client
+from pos.pdf import statement_cache_key, statement_pdf_path, remove_stale_pdfs, render_pdf_file
+from pos.views import bulk_statement_contexts
+
+
+class Command(BaseCommand):
+    help = 'Genera un ZIP con el estado de cuenta en PDF de cada cliente con saldo pendiente'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Ruta del ZIP (por defecto estados-AAAA-MM.zip)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Procesos de renderizado en paralelo')
+
+    def handle(self, *args, **options):
+        output = options['output'] or f'estados-{timezone.localdate():%Y-%m}.zip'
+        timings = {}
+
+        start = time.perf_counter()
+        clients = Client.objects.exclude(cached_balance=0).order_by('name')
+        contexts = list(bulk_statement_contexts(clients, persist=True))
+        timings['consultas'] = time.perf_counter() - start
+
+        # HTML is rendered here (needs Django); only xhtml2pdf runs in the pool.
+        # PDFs already in the cache for the same statement are reused.
+        start = time.perf_counter()
+        template = get_template('pos/pdf/client_statement_pdf.html')
+        files = []  # (client, path)
+        pending = []  # (client, path, html)
+        for context in contexts:
+            client = context['client']
+            path = statement_pdf_path(client.id, statement_cache_key(context))
+            files.append((client, path))
+            if not path.exists():
+                pending.append((client, path, template.render(context)))
+        timings['html'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        failed = set()
+        if pending:
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                futures = {pool.submit(render_pdf_file, html, path): (client, path) for client, path, html in pending}
+                for future in as_completed(futures):
+                    client, path = futures[future]
+                    try:
+                        future.result()
+                    except Exception as exc:
+                        failed.add(client.id)
+                        self.stderr.write(f'PDF de {client.name} (#{client.id}) falló: {exc}')
+                    else:
+                        remove_stale_pdfs(client.id, keep=path)
+        timings['pdf'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for client, path in files:
+                if client.id not in failed:
+                    safe_name = re.sub(r'[^\w-]+', '_', client.name).strip('_')
+                    archive.write(path, f'Estado_Cuenta_{client.id}_{safe_name}.pdf')
+        timings['zip'] = time.perf_counter() - start
+
+        for stage, seconds in timings.items():
+            self.stdout.write(f'{stage:>10}: {seconds:.2f}s')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(files) - len(failed)} estados en {output} '
+            f'({len(pending) - len(failed)} generados, {len(files) - len(pending)} desde caché)'
+        ))
@@ -0,0 +1,96 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from pos.models import PdfRenderJob
+from pos.pdf import render_pdf_file, statement_pdf_path, remove_stale_pdfs
+
+
+# How often the queue is cleaned up (stale RUNNING jobs, old FAILED jobs)
+MAINTENANCE_SECONDS = 60
+# FAILED jobs are kept this long so the page can show the error
+FAILED_RETENTION = timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = 'Genera en segundo plano los PDF de estados de cuenta en cola'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                            help='Procesos de renderizado en paralelo')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Segundos entre revisiones de la cola')
+        parser.add_argument('--once', action='store_true',
+                            help='Procesar la cola actual y salir')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Segundos tras los cuales un trabajo en curso se da por abandonado')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        poll = options['poll']
+        stale_after = timedelta(seconds=options['stale_after'])
+
+        running = {}  # future -> (job, path)
+        next_maintenance = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                if time.monotonic() >= next_maintenance:
+                    self.clean_queue(stale_after)
+                    next_maintenance = time.monotonic() + MAINTENANCE_SECONDS
+                for job in self.claim_jobs(workers - len(running)):
+                    path = statement_pdf_path(job.client_id, job.cache_key)
+                    running[pool.submit(render_pdf_file, job.html, path)] = (job, path)
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(poll)
+                    continue
+
+                done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, path = running.pop(future)
+                    self.finish(job, path, future)
+
+    def clean_queue(self, stale_after):
+        now = timezone.now()
+        # Jobs left RUNNING by a worker that died go back to the queue. Only
+        # stale ones: another worker may be rendering the recent ones.
+        PdfRenderJob.objects.filter(status=PdfRenderJob.RUNNING, updated_at__lt=now - stale_after).update(
+            status=PdfRenderJob.PENDING, updated_at=now,
+        )
+        PdfRenderJob.objects.filter(status=PdfRenderJob.FAILED, updated_at__lt=now - FAILED_RETENTION).delete()
+
+    def claim_jobs(self, slots):
+        if slots <= 0:
+            return []
+        claimed = []
+        candidates = PdfRenderJob.objects.filter(status=PdfRenderJob.PENDING).order_by('created_at')[:slots]
+        for job in candidates:
+            # Conditional update so two workers never take the same job
+            taken = PdfRenderJob.objects.filter(pk=job.pk, status=PdfRenderJob.PENDING).update(
+                status=PdfRenderJob.RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now(),
+            )
+            if taken:
+                claimed.append(job)
+        return claimed
+
+    def finish(self, job, path, future):
+        try:
+            future.result()
+        except Exception as exc:
+            PdfRenderJob.objects.filter(pk=job.pk).update(
+                status=PdfRenderJob.FAILED, error=str(exc), updated_at=timezone.now(),
+            )
+            self.stderr.write(f'PDF cliente #{job.client_id} falló: {exc}')
+            return
+        remove_stale_pdfs(job.client_id, keep=path)
+        # The file is served from disk from now on; the job (and its HTML) is done with
+        PdfRenderJob.objects.filter(pk=job.pk).delete()
+        self.stdout.write(f'PDF cliente #{job.client_id} listo')
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from pos import stats_cache
+from pos.models import Client, Sale, Payment
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el saldo guardado de cada cliente a partir de las tablas Sale/Payment'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Solo verificar: reporta diferencias sin modificar nada',
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+
+        # Two grouped queries for every client instead of two per client
+        expected = {}
+        for row in Sale.objects.filter(payment_method='CREDIT').values('client_id').annotate(s=Sum('total')):
+            expected[row['client_id']] = expected.get(row['client_id'], 0) + (row['s'] or 0)
+        for row in Payment.objects.filter(client__isnull=False).values('client_id').annotate(s=Sum('amount')):
+            expected[row['client_id']] = expected.get(row['client_id'], 0) - (row['s'] or 0)
+
+        mismatches = []
+        for client_id, name, stored in Client.objects.values_list('id', 'name', 'cached_balance'):
+            real = expected.get(client_id, 0)
+            if stored != real:
+                mismatches.append((client_id, name, stored, real))
+
+        for client_id, name, stored, real in mismatches:
+            self.stdout.write(f'Cliente #{client_id} {name}: guardado={stored} real={real}')
+
+        if check_only:
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} saldos no coinciden')
+            self.stdout.write(self.style.SUCCESS('Todos los saldos coinciden'))
+            return
+
+        fixed = 0
+        for client_id, _, _, _ in mismatches:
+            # Compare and write again under the client's lock: a sale or payment
+            # since the grouped queries above has already applied its own delta
+            with transaction.atomic():
+                Client.lock(client_id)
+                client = Client.objects.get(pk=client_id)
+                real = client.compute_balance()
+                if client.cached_balance != real:
+                    Client.objects.filter(pk=client_id).update(cached_balance=real)
+                    fixed += 1
+        stats_cache.invalidate(stats_cache.BALANCES)
+
+        self.stdout.write(self.style.SUCCESS(f'{fixed} saldos corregidos'))
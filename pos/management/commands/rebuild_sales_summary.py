@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pos import rollups, stats_cache
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los resúmenes diarios de ventas y productos desde Sale/SaleItem'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            days, product_rows = rollups.rebuild()
+        stats_cache.invalidate(stats_cache.SALES)
+        self.stdout.write(self.style.SUCCESS(
+            f'{days} días y {product_rows} filas de productos recalculados'
+        ))
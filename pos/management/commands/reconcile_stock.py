@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pos import catalog, stock
+from pos.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el stock de cada producto como la suma de sus movimientos de inventario'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Solo verificar: reporta diferencias sin modificar nada',
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+
+        with transaction.atomic():
+            # One grouped query over the journal for every product
+            expected = stock.journal_totals()
+            mismatches = []
+            for product_id, name, stored in Product.objects.values_list('id', 'name', 'stock').iterator():
+                real = expected.get(product_id, 0)
+                if stored != real:
+                    mismatches.append((product_id, name, stored, real))
+
+            for product_id, name, stored, real in mismatches:
+                self.stdout.write(f'Producto #{product_id} {name}: guardado={stored} movimientos={real}')
+
+            if check_only:
+                if mismatches:
+                    raise CommandError(f'{len(mismatches)} productos con stock distinto a sus movimientos')
+                self.stdout.write(self.style.SUCCESS('Todo el stock coincide con los movimientos'))
+                return
+
+            Product.objects.bulk_update(
+                [Product(id=product_id, stock=real) for product_id, _, _, real in mismatches],
+                ['stock'], batch_size=500,
+            )
+            catalog.record_changes([product_id for product_id, _, _, _ in mismatches])
+
+        self.stdout.write(self.style.SUCCESS(f'{len(mismatches)} productos corregidos'))
@@ -0,0 +1,188 @@
+"""
+Per-request timing and SQL instrumentation.
+
+`RequestMetricsMiddleware` wraps every request in `connection.execute_wrapper`
+to count queries and their time, adds a `Server-Timing` header (visible in the
+browser dev tools) and aggregates per view:
+
+- wall time, DB time and query count, as percentiles over the last
+  `SAMPLES_PER_VIEW` requests plus running totals;
+- possible N+1 patterns: the same SQL shape (numbers and IN lists collapsed)
+  run `METRICS_N_PLUS_ONE_THRESHOLD` or more times in one request. These are
+  also logged as warnings.
+
+Stats are kept per process (each gunicorn worker has its own) and exposed in
+Prometheus text format by the `metrics` view.
+
+Under ASGI the middleware runs async. Its queries run in the request's
+thread-sensitive executor thread (async ORM calls and sync views alike), so
+the recorder is installed on that thread's connection.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+SAMPLES_PER_VIEW = 1000
+QUANTILES = (0.5, 0.95, 0.99)
+
+_PLACEHOLDER_LIST = re.compile(r'%s(\s*,\s*%s)+')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def sql_shape(sql):
+    """SQL with numbers and placeholder lists collapsed, to spot repeated queries"""
+    return _NUMBER.sub('?', _PLACEHOLDER_LIST.sub('%s...', sql))
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.n_plus_one = 0
+        self.total_seconds = 0.0
+        self.total_db_seconds = 0.0
+        self.total_queries = 0
+        self.durations = deque(maxlen=SAMPLES_PER_VIEW)
+        self.db_durations = deque(maxlen=SAMPLES_PER_VIEW)
+        self.queries = deque(maxlen=SAMPLES_PER_VIEW)
+
+
+_stats = {}  # view name -> ViewStats
+_lock = threading.Lock()
+
+
+def record(view, seconds, recorder, status, repeated):
+    with _lock:
+        stats = _stats.get(view)
+        if stats is None:
+            stats = _stats[view] = ViewStats()
+        stats.requests += 1
+        stats.errors += status >= 500
+        stats.n_plus_one += bool(repeated)
+        stats.total_seconds += seconds
+        stats.total_db_seconds += recorder.seconds
+        stats.total_queries += recorder.count
+        stats.durations.append(seconds)
+        stats.db_durations.append(recorder.seconds)
+        stats.queries.append(recorder.count)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def prometheus_text():
+    """Current stats in Prometheus text exposition format"""
+    with _lock:
+        views = sorted(_stats.items())
+        summaries = [
+            ('pos_request_duration_seconds', 'Wall time per request', 'durations', 'total_seconds'),
+            ('pos_request_db_seconds', 'Time spent in SQL per request', 'db_durations', 'total_db_seconds'),
+            ('pos_request_queries', 'SQL queries per request', 'queries', 'total_queries'),
+        ]
+        lines = []
+        for metric, help_text, samples, total in summaries:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} summary']
+            for view, stats in views:
+                values = getattr(stats, samples)
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{view="{view}",quantile="{q}"}} {percentile(values, q):g}')
+                lines.append(f'{metric}_sum{{view="{view}"}} {getattr(stats, total):g}')
+                lines.append(f'{metric}_count{{view="{view}"}} {stats.requests}')
+        counters = [
+            ('pos_request_errors_total', 'Requests answered with a 5xx status', 'errors'),
+            ('pos_request_n_plus_one_total', 'Requests that repeated the same SQL shape', 'n_plus_one'),
+        ]
+        for metric, help_text, attr in counters:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for view, stats in views:
+                lines.append(f'{metric}{{view="{view}"}} {getattr(stats, attr)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _install(recorder):
+    connection.execute_wrappers.append(recorder)
+
+
+def _uninstall(recorder):
+    connection.execute_wrappers.remove(recorder)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        await sync_to_async(_install)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_uninstall)(recorder)
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    def finish(self, request, response, recorder, seconds):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        repeated = {shape: n for shape, n in recorder.shapes.items() if n >= self.threshold}
+        if repeated:
+            shape, n = max(repeated.items(), key=lambda item: item[1])
+            logger.warning('Posible N+1 en %s: %d veces %s', view, n, shape[:200])
+        record(view, seconds, recorder, response.status_code, repeated)
+
+        response['Server-Timing'] = (
+            f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries", '
+            f'total;dur={seconds * 1000:.1f}'
+        )
+        return response
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 20:33
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_cached_balance(apps, schema_editor):
+    Client = apps.get_model('pos', 'Client')
+    Sale = apps.get_model('pos', 'Sale')
+    Payment = apps.get_model('pos', 'Payment')
+
+    balances = {}
+    for row in Sale.objects.filter(payment_method='CREDIT').values('client_id').annotate(s=Sum('total')):
+        balances[row['client_id']] = balances.get(row['client_id'], 0) + (row['s'] or 0)
+    for row in Payment.objects.filter(client__isnull=False).values('client_id').annotate(s=Sum('amount')):
+        balances[row['client_id']] = balances.get(row['client_id'], 0) - (row['s'] or 0)
+
+    for client_id, balance in balances.items():
+        Client.objects.filter(pk=client_id).update(cached_balance=balance)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0004_alter_payment_amount_alter_product_price_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='cached_balance',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_cached_balance, migrations.RunPython.noop),
+    ]
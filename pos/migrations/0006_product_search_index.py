@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-17 21:05
+
+from django.db import migrations, OperationalError
+
+# Frozen copy of pos.search.SQLITE_INDEX_SQL as of this migration, so later
+# changes to pos.search don't change what this migration creates. apps.py
+# reinstalls the current index after every migrate.
+INDEX_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS pos_product_fts USING fts5(
+        name, barcode,
+        content='pos_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS pos_product_fts_ai AFTER INSERT ON pos_product BEGIN
+        INSERT INTO pos_product_fts(rowid, name, barcode) VALUES (new.id, new.name, new.barcode);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS pos_product_fts_ad AFTER DELETE ON pos_product BEGIN
+        INSERT INTO pos_product_fts(pos_product_fts, rowid, name, barcode) VALUES ('delete', old.id, old.name, old.barcode);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS pos_product_fts_au AFTER UPDATE OF name, barcode ON pos_product BEGIN
+        INSERT INTO pos_product_fts(pos_product_fts, rowid, name, barcode) VALUES ('delete', old.id, old.name, old.barcode);
+        INSERT INTO pos_product_fts(rowid, name, barcode) VALUES (new.id, new.name, new.barcode);
+    END""",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            for statement in INDEX_SQL:
+                cursor.execute(statement)
+        except OperationalError:
+            # SQLite compiled without FTS5: searches use the fallback
+            return
+        cursor.execute("INSERT INTO pos_product_fts(pos_product_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for trigger in ('pos_product_fts_ai', 'pos_product_fts_ad', 'pos_product_fts_au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute('DROP TABLE IF EXISTS pos_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0005_client_cached_balance'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
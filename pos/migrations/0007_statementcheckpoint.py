@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-17 20:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('event_type', models.SmallIntegerField()),
+                ('event_id', models.BigIntegerField()),
+                ('balance', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statement_checkpoint', to='pos.client')),
+            ],
+        ),
+    ]
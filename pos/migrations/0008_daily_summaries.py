@@ -0,0 +1,81 @@
+# Generated by Django 6.0 on 2026-10-17 20:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum, Count, Q
+from django.db.models.functions import TruncDate
+
+
+# Frozen copy of pos.rollups.rebuild as of this migration, so later changes
+# to rollups or the models don't change what this migration writes
+def backfill_summaries(apps, schema_editor):
+    Sale = apps.get_model('pos', 'Sale')
+    SaleItem = apps.get_model('pos', 'SaleItem')
+    SalesSummary = apps.get_model('pos', 'DailySalesSummary')
+    ProductSummary = apps.get_model('pos', 'DailyProductSummary')
+
+    days = (
+        Sale.objects.annotate(day=TruncDate('date'))
+        .values('day')
+        .annotate(
+            total_sum=Sum('total'),
+            cash_sum=Sum('total', filter=Q(payment_method='CASH')),
+            credit_sum=Sum('total', filter=Q(payment_method='CREDIT')),
+            sales=Count('id'),
+        )
+        .order_by('day')
+    )
+    products = (
+        SaleItem.objects.annotate(day=TruncDate('sale__date'))
+        .values('day', 'product_id')
+        .annotate(units=Sum('quantity'))
+        .order_by('day')
+    )
+    SalesSummary.objects.bulk_create([
+        SalesSummary(
+            date=row['day'],
+            total=row['total_sum'] or 0,
+            cash_total=row['cash_sum'] or 0,
+            credit_total=row['credit_sum'] or 0,
+            sale_count=row['sales'],
+        )
+        for row in days
+    ], batch_size=500)
+    ProductSummary.objects.bulk_create([
+        ProductSummary(date=row['day'], product_id=row['product_id'], quantity=row['units'] or 0)
+        for row in products.iterator(chunk_size=2000)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0007_statementcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('total', models.IntegerField(default=0)),
+                ('cash_total', models.IntegerField(default=0)),
+                ('credit_total', models.IntegerField(default=0)),
+                ('sale_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyProductSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pos.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_product')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
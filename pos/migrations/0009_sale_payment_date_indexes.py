@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-17 20:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0008_daily_summaries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['client', 'date'], name='payment_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['date'], name='sale_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['payment_method', 'date'], name='sale_method_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['client', 'date'], name='sale_client_date_idx'),
+        ),
+    ]
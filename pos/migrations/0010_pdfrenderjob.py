@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 20:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0009_sale_payment_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('html', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pendiente'), ('RUNNING', 'Generando'), ('DONE', 'Listo'), ('FAILED', 'Error')], default='PENDING', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pdf_jobs', to='pos.client')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='pdfjob_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0010_pdfrenderjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='uuid',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
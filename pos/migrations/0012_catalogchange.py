@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 20:52
+
+from django.db import migrations, models
+
+
+def record_existing_products(apps, schema_editor):
+    Product = apps.get_model('pos', 'Product')
+    CatalogChange = apps.get_model('pos', 'CatalogChange')
+    CatalogChange.objects.bulk_create(
+        [CatalogChange(product_id=pid) for pid in Product.objects.order_by('id').values_list('id', flat=True)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0011_sale_uuid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField(unique=True)),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.RunPython(record_existing_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0 on 2026-10-17 21:04
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Copies of Client.normalize_phone / normalize_name as of this migration, so
+# later changes to the model don't change what this migration writes
+def normalize_phone(phone):
+    return re.sub(r'\D', '', phone or '')
+
+
+def normalize_name(name):
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+
+def fill_lookup_keys(apps, schema_editor):
+    Client = apps.get_model('pos', 'Client')
+    clients = list(Client.objects.only('id', 'name', 'phone'))
+    for client in clients:
+        client.phone_digits = normalize_phone(client.phone)[:20]
+        client.name_key = normalize_name(client.name)[:200]
+    Client.objects.bulk_update(clients, ['phone_digits', 'name_key'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0012_catalogchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='name_key',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='phone_digits',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['phone_digits'], name='client_phone_digits_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['name_key'], name='client_name_key_idx'),
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+    ]
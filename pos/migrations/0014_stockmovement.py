@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 21:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def record_opening_stock(apps, schema_editor):
+    Product = apps.get_model('pos', 'Product')
+    StockMovement = apps.get_model('pos', 'StockMovement')
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(product_id=pid, kind='ADJUSTMENT', quantity=stock, note='Stock inicial')
+            for pid, stock in Product.objects.exclude(stock=0).order_by('id').values_list('id', 'stock')
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0013_client_lookup_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('SALE', 'Venta'), ('RESTOCK', 'Reposición'), ('ADJUSTMENT', 'Ajuste'), ('EDIT', 'Edición de venta')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='pos.product')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='pos.sale')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_at'], name='stockmove_product_date_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_stock, migrations.RunPython.noop),
+    ]
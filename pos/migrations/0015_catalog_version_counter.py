@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 22:02
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_changes(apps, schema_editor):
+    # Versions so far were change ids: keep them, so terminals can go on
+    # asking for ?since=<their version>
+    CatalogChange = apps.get_model('pos', 'CatalogChange')
+    FeedVersion = apps.get_model('pos', 'FeedVersion')
+    CatalogChange.objects.update(version=F('id'))
+    version = CatalogChange.objects.aggregate(version=Max('id'))['version'] or 0
+    FeedVersion.objects.create(name='products', version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0014_stockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedVersion',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='catalogchange',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(number_existing_changes, migrations.RunPython.noop),
+    ]
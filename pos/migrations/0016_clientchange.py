@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-17 22:03
+
+from django.db import migrations, models
+
+
+def record_existing_clients(apps, schema_editor):
+    Client = apps.get_model('pos', 'Client')
+    ClientChange = apps.get_model('pos', 'ClientChange')
+    FeedVersion = apps.get_model('pos', 'FeedVersion')
+    ClientChange.objects.bulk_create(
+        [ClientChange(client_id=pid, version=1) for pid in Client.objects.order_by('id').values_list('id', flat=True)],
+        batch_size=500,
+    )
+    FeedVersion.objects.create(name='clients', version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0015_catalog_version_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.BigIntegerField(unique=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('version', models.BigIntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.RunPython(record_existing_clients, migrations.RunPython.noop),
+    ]
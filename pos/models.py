@@ -1,3 +1,6 @@
+import re
+import unicodedata
+
 from django.db import models
 from django.utils import timezone
 
@@ -24,16 +27,70 @@ class Client(models.Model):
     email = models.EmailField(blank=True)
     address = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Running balance (credit sales - payments), kept in sync by the views
+    # that write sales/payments. Rebuild with `manage.py rebuild_balances`.
+    cached_balance = models.IntegerField(default=0)
+    # Lookup keys for the client typeahead and the public debt check, set in
+    # save() (bulk inserts call fill_lookup_keys): digits of the phone, and the
+    # name lowercased without accents for prefix matching.
+    phone_digits = models.CharField(max_length=20, blank=True, editable=False)
+    name_key = models.CharField(max_length=200, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['phone_digits'], name='client_phone_digits_idx'),
+            models.Index(fields=['name_key'], name='client_name_key_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def normalize_phone(phone):
+        return re.sub(r'\D', '', phone or '')
+
+    @staticmethod
+    def normalize_name(name):
+        decomposed = unicodedata.normalize('NFKD', name or '')
+        return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+    def fill_lookup_keys(self):
+        self.phone_digits = self.normalize_phone(self.phone)[:20]
+        self.name_key = self.normalize_name(self.name)[:200]
+
+    def save(self, *args, **kwargs):
+        self.fill_lookup_keys()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'phone_digits', 'name_key'}
+        super().save(*args, **kwargs)
+
     @property
     def balance(self):
+        return self.cached_balance
+
+    def compute_balance(self):
+        """Balance straight from the Sale/Payment tables (slow path)"""
         credit_sales = self.sale_set.filter(payment_method='CREDIT').aggregate(models.Sum('total'))['total__sum'] or 0
         payments = self.payments.aggregate(models.Sum('amount'))['amount__sum'] or 0
         return credit_sales - payments
 
+    def refresh_balance(self):
+        """Recompute the cached balance from the raw tables and store it"""
+        self.cached_balance = self.compute_balance()
+        Client.objects.filter(pk=self.pk).update(cached_balance=self.cached_balance)
+        return self.cached_balance
+
+    @staticmethod
+    def adjust_balance(client_id, delta):
+        """Apply a balance change atomically (no read-modify-write)"""
+        if delta:
+            Client.objects.filter(pk=client_id).update(cached_balance=models.F('cached_balance') + delta)
+
+    @staticmethod
+    def lock(client_id):
+        """Lock the client's row until the transaction ends (SQLite locks the whole database instead)"""
+        list(Client.objects.select_for_update().filter(pk=client_id).values_list('id', flat=True))
+
 class Sale(models.Model):
     PAYMENT_METHODS = [
         ('CASH', 'Contado'),
@@ -45,10 +102,24 @@ class Sale(models.Model):
     total = models.IntegerField(default=0)
     is_paid = models.BooleanField(default=True) # Cash is paid immediately
     note = models.TextField(blank=True, null=True)
+    # Set by registers that sold offline, so re-sent sales are not duplicated
+    uuid = models.UUIDField(unique=True, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date'], name='sale_date_idx'),
+            models.Index(fields=['payment_method', 'date'], name='sale_method_date_idx'),
+            models.Index(fields=['client', 'date'], name='sale_client_date_idx'),
+        ]
 
     def __str__(self):
         return f"Factura #{self.id} - {self.client.name}"
 
+    @staticmethod
+    def lock(sale_id):
+        """Lock the sale's row until the transaction ends, serializing edits of the invoice"""
+        list(Sale.objects.select_for_update().filter(pk=sale_id).values_list('id', flat=True))
+
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
@@ -66,5 +137,164 @@ class Payment(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     note = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['client', 'date'], name='payment_client_date_idx'),
+        ]
+
     def __str__(self):
         return f"Pago {self.amount} - {self.client.name}"
+
+class StatementCheckpoint(models.Model):
+    """
+    Last point where a client's account balance was zero.
+
+    Statements only need the events after it. The position is the sort key of
+    the event that closed the balance: (date, event_type, event_id).
+    """
+    SALE = 0
+    PAYMENT = 1
+
+    client = models.OneToOneField(Client, related_name='statement_checkpoint', on_delete=models.CASCADE)
+    date = models.DateTimeField()
+    event_type = models.SmallIntegerField()
+    event_id = models.BigIntegerField()
+    balance = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def key(self):
+        return (self.date, self.event_type, self.event_id)
+
+    @staticmethod
+    def invalidate(client_id, since):
+        """Drop the checkpoint if a change at `since` lands on or before it"""
+        # Serialized with checkpoint writes (see views.save_checkpoint)
+        Client.lock(client_id)
+        StatementCheckpoint.objects.filter(client_id=client_id, date__gte=since).delete()
+
+class DailySalesSummary(models.Model):
+    """Sales totals per local day, maintained with every sale write"""
+    date = models.DateField(unique=True)
+    total = models.IntegerField(default=0)
+    cash_total = models.IntegerField(default=0)
+    credit_total = models.IntegerField(default=0)
+    sale_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.total}"
+
+class DailyProductSummary(models.Model):
+    """Units sold per product per local day"""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_product'),
+        ]
+
+class PdfRenderJob(models.Model):
+    """Queued statement PDF, rendered by `manage.py pdf_worker`"""
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUSES = [
+        (PENDING, 'Pendiente'),
+        (RUNNING, 'Generando'),
+        (DONE, 'Listo'),
+        (FAILED, 'Error'),
+    ]
+    MAX_ATTEMPTS = 3
+
+    client = models.ForeignKey(Client, related_name='pdf_jobs', on_delete=models.CASCADE)
+    cache_key = models.CharField(max_length=64, unique=True)
+    html = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='pdfjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"PDF {self.client_id} {self.status}"
+
+class FeedVersion(models.Model):
+    """
+    Version counter of a terminal feed (pos/catalog.py), one row per feed.
+
+    Writers lock the row, bump it and stamp their change rows with the new
+    value in the same transaction, so versions become visible in commit
+    order (an autoincrement id is handed out before commit, so a reader
+    could see id 11 committed while id 10 is still pending).
+    """
+    name = models.CharField(max_length=20, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+class CatalogChange(models.Model):
+    """
+    Latest change of each product, for the catalog delta feed (pos/catalog.py).
+
+    A change replaces the product's row and carries the catalog version it
+    was made in: everything with version > N changed after version N. No FK,
+    deleted products keep their row (deleted=True) so terminals drop them.
+    """
+    product_id = models.BigIntegerField(unique=True)
+    deleted = models.BooleanField(default=False)
+    version = models.BigIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"Cambio v{self.version} producto {self.product_id}"
+
+class ClientChange(models.Model):
+    """Latest change of each client, for the register's client feed (pos/catalog.py). Same scheme as CatalogChange."""
+    client_id = models.BigIntegerField(unique=True)
+    deleted = models.BooleanField(default=False)
+    version = models.BigIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"Cambio v{self.version} cliente {self.client_id}"
+
+class StockMovement(models.Model):
+    """
+    Append-only journal of stock changes (pos/stock.py).
+
+    Product.stock is the running sum of its movements, kept up to date with
+    F() updates in the same transaction. Rebuild it with
+    `manage.py reconcile_stock`.
+    """
+    SALE = 'SALE'
+    RESTOCK = 'RESTOCK'
+    ADJUSTMENT = 'ADJUSTMENT'
+    SALE_EDIT = 'EDIT'
+    KINDS = [
+        (SALE, 'Venta'),
+        (RESTOCK, 'Reposición'),
+        (ADJUSTMENT, 'Ajuste'),
+        (SALE_EDIT, 'Edición de venta'),
+    ]
+
+    product = models.ForeignKey(Product, related_name='stock_movements', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    quantity = models.IntegerField()  # Signed: sales are negative
+    sale = models.ForeignKey(Sale, related_name='stock_movements', on_delete=models.SET_NULL, null=True, blank=True)
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='stockmove_product_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.quantity:+d} - producto {self.product_id}"
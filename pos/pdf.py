@@ -0,0 +1,64 @@
+"""
+Statement PDF rendering and on-disk cache.
+
+PDFs are rendered outside the request by `manage.py pdf_worker` and stored
+under settings.PDF_CACHE_DIR. Files are named after a hash of the statement
+contents (client data and every event shown), so a client's PDF is rendered
+once per change in their account and then served from disk.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+
+
+def statement_cache_key(context):
+    """Hash of everything a statement shows, except the generation time"""
+    client = context['client']
+    digest = hashlib.sha256()
+    digest.update(repr((client.id, client.name, client.phone, client.email)).encode())
+    digest.update(repr((context['total_credit'], context['total_paid'], context['current_debt'])).encode())
+    for event in context['timeline']:
+        items = [(i.product.name, i.quantity, i.price) for i in event.get('items', [])]
+        digest.update(repr((
+            event['key'], event['amount'], event['balance'], event['ref'],
+            event['object'].note, items,
+        )).encode())
+    return digest.hexdigest()
+
+
+def cache_dir():
+    path = Path(settings.PDF_CACHE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def statement_pdf_path(client_id, cache_key):
+    return cache_dir() / f'statement-{client_id}-{cache_key[:32]}.pdf'
+
+
+def remove_stale_pdfs(client_id, keep):
+    """Delete older cached statements of a client, keeping `keep`"""
+    for path in cache_dir().glob(f'statement-{client_id}-*.pdf'):
+        if path != keep:
+            path.unlink(missing_ok=True)
+
+
+def render_pdf_file(html, path):
+    """
+    Render HTML to a PDF file. Runs in worker processes, so it only takes
+    plain values and writes to a temp file first (readers never see a
+    half-written PDF).
+    """
+    from xhtml2pdf import pisa
+
+    path = Path(path)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        status = pisa.CreatePDF(html, dest=f)
+    if status.err:
+        tmp_path.unlink(missing_ok=True)
+        raise RuntimeError(f'xhtml2pdf reported {status.err} errors')
+    os.replace(tmp_path, path)
+    return str(path)
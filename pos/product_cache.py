@@ -0,0 +1,89 @@
+"""
+Process-local LRU caches of (id, name, price) by barcode, for the scanner
+path, and by product id, to check that a product added to the cart exists.
+Cart totals are priced from the database (see cart.py).
+
+Each gunicorn worker keeps its own copy. Writes through the views invalidate
+the entry in the worker that handled them; entries also expire after
+`TTL_SECONDS` so other workers pick up price changes shortly after.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from .models import Product
+
+MAX_ENTRIES = 5000
+TTL_SECONDS = 60
+
+CachedProduct = namedtuple('CachedProduct', ['id', 'name', 'price'])
+
+_entries = OrderedDict()  # barcode -> (expires_at, CachedProduct)
+_by_id = OrderedDict()  # product id -> (expires_at, CachedProduct)
+_lock = threading.Lock()
+
+
+def lookup_barcode(barcode):
+    """Resolve a barcode, hitting the database only on a miss. None if unknown."""
+    barcode = (barcode or '').strip()
+    if not barcode:
+        return None
+
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(barcode)
+        if entry and entry[0] > now:
+            _entries.move_to_end(barcode)
+            return entry[1]
+
+    row = Product.objects.filter(barcode=barcode).values_list('id', 'name', 'price').first()
+    if row is None:
+        return None
+
+    product = CachedProduct(*row)
+    with _lock:
+        _entries[barcode] = (now + TTL_SECONDS, product)
+        _entries.move_to_end(barcode)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+    return product
+
+
+def get_products(ids):
+    """{id: CachedProduct} for the given ids, one query for all misses. Unknown ids are left out."""
+    now = time.monotonic()
+    found = {}
+    with _lock:
+        for product_id in ids:
+            entry = _by_id.get(product_id)
+            if entry and entry[0] > now:
+                _by_id.move_to_end(product_id)
+                found[product_id] = entry[1]
+
+    missing = [product_id for product_id in ids if product_id not in found]
+    if missing:
+        rows = Product.objects.filter(id__in=missing).values_list('id', 'name', 'price')
+        with _lock:
+            for row in rows:
+                product = CachedProduct(*row)
+                found[product.id] = product
+                _by_id[product.id] = (now + TTL_SECONDS, product)
+                _by_id.move_to_end(product.id)
+            while len(_by_id) > MAX_ENTRIES:
+                _by_id.popitem(last=False)
+    return found
+
+
+def invalidate(*barcodes, product_id=None):
+    with _lock:
+        for barcode in barcodes:
+            if barcode:
+                _entries.pop(barcode, None)
+        if product_id is not None:
+            _by_id.pop(product_id, None)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _by_id.clear()
@@ -0,0 +1,171 @@
+"""
+Bulk product import from supplier CSV files (`manage.py import_products` and
+the upload form on the inventory page).
+
+Rows are read as a stream and written in chunks of `CHUNK_SIZE`, each chunk in
+its own transaction and the same few queries whatever its size: one to find
+which barcodes exist, the upsert (`bulk_create(update_conflicts=True)` on the
+barcode) and the catalog change log. Memory stays bounded whatever the file
+size; only the first `MAX_ERRORS` row errors are kept.
+
+Columns (header names in Spanish or English, `,` `;` or tab separated):
+
+- barcode / codigo: required, the upsert key;
+- name / nombre: required for new products;
+- price / precio and stock / cantidad: whole numbers.
+
+Only the columns present in the file are updated on existing products. A row
+with an error is skipped; the rest of its chunk is still written. Stock is
+not overwritten: the difference is journaled as an adjustment (pos/stock.py).
+
+Bulk writes skip model signals, so the catalog feed, product cache and report
+cache are updated here. The FTS search index follows through its triggers.
+"""
+import csv
+import re
+from itertools import islice
+
+from django.db import transaction
+
+from . import catalog, product_cache, stats_cache, stock
+from .models import Product, StockMovement
+
+CHUNK_SIZE = 2000
+MAX_ERRORS = 1000
+
+COLUMNS = {
+    'barcode': 'barcode', 'codigo': 'barcode', 'código': 'barcode', 'codigo de barras': 'barcode',
+    'name': 'name', 'nombre': 'name',
+    'price': 'price', 'precio': 'price',
+    'stock': 'stock', 'cantidad': 'stock',
+}
+
+_THOUSANDS = re.compile(r'^\d{1,3}([.,]\d{3})+$')
+
+
+class ImportFileError(ValueError):
+    """The file can't be imported at all (as opposed to a bad row)"""
+
+
+def parse_int(value):
+    value = value.strip().lstrip('$').strip()
+    if _THOUSANDS.match(value):
+        value = re.sub(r'[.,]', '', value)
+    return int(value)
+
+
+def open_csv(text_file):
+    """DictReader over a seekable text file, guessing the delimiter from its start"""
+    sample = text_file.read(4096)
+    text_file.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return csv.DictReader(text_file, dialect=dialect)
+
+
+def map_header(fieldnames):
+    mapping = {}
+    for name in fieldnames or []:
+        field = COLUMNS.get((name or '').strip().lower())
+        if field and field not in mapping.values():
+            mapping[name] = field
+    if 'barcode' not in mapping.values():
+        raise ImportFileError('El archivo no tiene columna de código de barras (barcode / codigo)')
+    return mapping
+
+
+def parse_row(raw, mapping):
+    row = {}
+    for column, field in mapping.items():
+        value = (raw.get(column) or '').strip()
+        if field in ('price', 'stock'):
+            if not value:
+                raise ValueError(f'{field} vacío')
+            try:
+                value = parse_int(value)
+            except ValueError:
+                raise ValueError(f'{field} no es un número entero: {value!r}')
+            if field == 'price' and value < 0:
+                raise ValueError('precio negativo')
+        elif not value:
+            raise ValueError('código de barras vacío' if field == 'barcode' else 'nombre vacío')
+        row[field] = value
+    if len(row['barcode']) > 100:
+        raise ValueError('código de barras demasiado largo')
+    if len(row.get('name', '')) > 200:
+        raise ValueError('nombre demasiado largo')
+    return row
+
+
+def import_products(text_file, chunk_size=CHUNK_SIZE):
+    """
+    Upsert the products of a CSV text file by barcode.
+
+    Returns {'rows', 'created', 'updated', 'errors': [(line, message)],
+    'error_count'}. Line numbers count the header as line 1.
+    """
+    reader = open_csv(text_file)
+    mapping = map_header(reader.fieldnames)
+    update_fields = [field for field in mapping.values() if field not in ('barcode', 'stock')]
+    result = {'rows': 0, 'created': 0, 'updated': 0, 'errors': [], 'error_count': 0}
+
+    def error(line, message):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_ERRORS:
+            result['errors'].append((line, message))
+
+    numbered = ((reader.line_num, raw) for raw in reader)
+    renamed = False
+    while True:
+        batch = list(islice(numbered, chunk_size))
+        if not batch:
+            break
+        rows = {}  # barcode -> (line, row); a repeated barcode keeps the last row
+        for line, raw in batch:
+            result['rows'] += 1
+            try:
+                row = parse_row(raw, mapping)
+            except ValueError as exc:
+                error(line, str(exc))
+                continue
+            rows[row['barcode']] = (line, row)
+
+        with transaction.atomic():
+            # barcode -> current stock, locked until the adjustments are written
+            existing = dict(
+                Product.objects.select_for_update().filter(barcode__in=list(rows)).values_list('barcode', 'stock')
+            )
+            products = []
+            for barcode, (row_line, row) in rows.items():
+                if barcode not in existing and 'name' not in row:
+                    error(row_line, 'producto nuevo sin nombre')
+                    continue
+                products.append(Product(**{field: value for field, value in row.items() if field != 'stock'}))
+            if not products:
+                continue
+            if update_fields:
+                Product.objects.bulk_create(
+                    products, update_conflicts=True, unique_fields=['barcode'], update_fields=update_fields,
+                )
+            else:
+                Product.objects.bulk_create(products, ignore_conflicts=True)
+            ids = dict(Product.objects.filter(barcode__in=[p.barcode for p in products]).values_list('barcode', 'id'))
+            catalog.record_changes(ids.values())
+            if 'stock' in mapping.values():
+                stock.move(
+                    {ids[p.barcode]: rows[p.barcode][1]['stock'] - existing.get(p.barcode, 0) for p in products},
+                    StockMovement.ADJUSTMENT, note='Importación CSV',
+                )
+
+        updated = sum(p.barcode in existing for p in products)
+        result['updated'] += updated
+        result['created'] += len(products) - updated
+        renamed = renamed or bool(updated and 'name' in update_fields)
+
+    # Too many entries to drop one by one; reports show product names
+    product_cache.clear()
+    if renamed:
+        stats_cache.invalidate(stats_cache.SALES)
+    return result
@@ -0,0 +1,82 @@
+"""
+Daily sales rollups (DailySalesSummary / DailyProductSummary).
+
+Every view that writes a sale calls these helpers inside its transaction, so
+the dashboard and reports read a handful of summary rows instead of scanning
+Sale/SaleItem. Days are local days (settings.TIME_ZONE).
+
+Rows are created with INSERT ... ON CONFLICT DO NOTHING and then incremented
+with F() expressions, so concurrent sales on the same day don't lose updates.
+`manage.py rebuild_sales_summary` recomputes everything from the raw tables.
+"""
+from django.db.models import F, Sum, Count, Q, Case, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Sale, SaleItem, DailySalesSummary, DailyProductSummary
+
+
+def add_sale(date, payment_method, total, count=1):
+    """Add (or with negative values, remove) a sale to its day's totals"""
+    day = timezone.localdate(date)
+    DailySalesSummary.objects.bulk_create([DailySalesSummary(date=day)], ignore_conflicts=True)
+    DailySalesSummary.objects.filter(date=day).update(
+        total=F('total') + total,
+        cash_total=F('cash_total') + (total if payment_method == 'CASH' else 0),
+        credit_total=F('credit_total') + (total if payment_method == 'CREDIT' else 0),
+        sale_count=F('sale_count') + count,
+    )
+
+
+def add_products(date, quantities):
+    """Add units sold for several products ({product_id: quantity}) in two queries"""
+    quantities = {pid: qty for pid, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    day = timezone.localdate(date)
+    DailyProductSummary.objects.bulk_create(
+        [DailyProductSummary(date=day, product_id=pid) for pid in quantities],
+        ignore_conflicts=True,
+    )
+    DailyProductSummary.objects.filter(date=day, product_id__in=quantities).update(
+        quantity=F('quantity') + Case(*[When(product_id=pid, then=qty) for pid, qty in quantities.items()])
+    )
+
+
+def rebuild():
+    """Recompute every summary row from Sale/SaleItem. Returns (days, product rows)."""
+    days = (
+        Sale.objects.annotate(day=TruncDate('date'))
+        .values('day')
+        .annotate(
+            total_sum=Sum('total'),
+            cash_sum=Sum('total', filter=Q(payment_method='CASH')),
+            credit_sum=Sum('total', filter=Q(payment_method='CREDIT')),
+            sales=Count('id'),
+        )
+        .order_by('day')
+    )
+    products = (
+        SaleItem.objects.annotate(day=TruncDate('sale__date'))
+        .values('day', 'product_id')
+        .annotate(units=Sum('quantity'))
+        .order_by('day')
+    )
+
+    DailySalesSummary.objects.all().delete()
+    DailyProductSummary.objects.all().delete()
+    sales_rows = DailySalesSummary.objects.bulk_create([
+        DailySalesSummary(
+            date=row['day'],
+            total=row['total_sum'] or 0,
+            cash_total=row['cash_sum'] or 0,
+            credit_total=row['credit_sum'] or 0,
+            sale_count=row['sales'],
+        )
+        for row in days
+    ], batch_size=500)
+    product_rows = DailyProductSummary.objects.bulk_create([
+        DailyProductSummary(date=row['day'], product_id=row['product_id'], quantity=row['units'] or 0)
+        for row in products.iterator(chunk_size=2000)
+    ], batch_size=500)
+    return len(sales_rows), len(product_rows)
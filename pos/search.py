@@ -0,0 +1,184 @@
+"""
+Product search backed by a SQLite FTS5 index.
+
+The index (`pos_product_fts`) is an external-content FTS5 table over
+`pos_product.name` / `pos_product.barcode`, kept in sync by SQLite triggers so
+every write path (views, admin, bulk updates) is covered. The `unicode61`
+tokenizer with `remove_diacritics` gives accent-insensitive matching, and each
+search term is used as a prefix ("arr" finds "Arroz Diana").
+
+On other database backends, or if SQLite was built without FTS5, searches fall
+back to `icontains`, always with a result limit.
+
+Client search (the POS / sale-edit typeahead) uses the indexed lookup keys on
+Client instead: a name prefix, or a phone prefix when the input is a number.
+"""
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connection, OperationalError
+from django.db.models.expressions import RawSQL
+
+from .models import Product, Client
+
+FTS_TABLE = 'pos_product_fts'
+
+SQLITE_INDEX_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, barcode,
+        content='pos_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS pos_product_fts_ai AFTER INSERT ON pos_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, barcode) VALUES (new.id, new.name, new.barcode);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS pos_product_fts_ad AFTER DELETE ON pos_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, barcode) VALUES ('delete', old.id, old.name, old.barcode);
+    END""",
+    # Only name/barcode changes touch the index; stock updates at checkout don't
+    f"""CREATE TRIGGER IF NOT EXISTS pos_product_fts_au AFTER UPDATE OF name, barcode ON pos_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, barcode) VALUES ('delete', old.id, old.name, old.barcode);
+        INSERT INTO {FTS_TABLE}(rowid, name, barcode) VALUES (new.id, new.name, new.barcode);
+    END""",
+]
+
+TRIGGER_NAMES = ('pos_product_fts_ai', 'pos_product_fts_ad', 'pos_product_fts_au')
+
+_fts_enabled = {}
+
+
+def install_sqlite_index(conn):
+    """
+    Create the FTS table and triggers if missing and (re)build the index.
+
+    Safe to call repeatedly. SQLite migrations that remake `pos_product` drop
+    its triggers, so this also runs after every `migrate` (see apps.py).
+    Returns False if this SQLite build has no FTS5.
+    """
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+            TRIGGER_NAMES,
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if len(existing) == len(TRIGGER_NAMES):
+            return True
+        try:
+            for statement in SQLITE_INDEX_SQL:
+                cursor.execute(statement)
+        except OperationalError:
+            # SQLite compiled without FTS5: searches use the fallback
+            return False
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_enabled.pop(conn.alias, None)
+    return True
+
+
+def fts_enabled():
+    if connection.alias not in _fts_enabled:
+        _fts_enabled[connection.alias] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_enabled[connection.alias]
+
+
+def build_match(query):
+    """Turn user input into an FTS5 expression: every term, as a prefix"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_products(query, limit=20):
+    """
+    Top `limit` products for `query`, best match first.
+
+    An exact barcode match (what a scanner sends) always comes first.
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    results = list(Product.objects.filter(barcode=query)[:1])
+
+    if fts_enabled():
+        match = build_match(query)
+        if match:
+            results += list(Product.objects.raw(
+                # FTS5 ranks the whole match set and keeps only the top
+                # `limit` (ORDER BY rank LIMIT n), so only those rows are joined
+                f"""WITH top AS (
+                        SELECT rowid AS id, rank FROM {FTS_TABLE}
+                        WHERE {FTS_TABLE} MATCH %s
+                        ORDER BY rank LIMIT %s
+                    )
+                    SELECT pos_product.* FROM top
+                    JOIN pos_product ON pos_product.id = top.id
+                    ORDER BY top.rank""",
+                [match, limit],
+            ))
+    else:
+        results += list(Product.objects.filter(name__icontains=query)[:limit])
+
+    # Drop the duplicate of the barcode hit, keep ranking order
+    seen = set()
+    unique = []
+    for product in results:
+        if product.id not in seen:
+            seen.add(product.id)
+            unique.append(product)
+    return unique[:limit]
+
+
+def filter_products(queryset, query):
+    """Restrict a Product queryset to index matches (keeps its ordering)"""
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    if fts_enabled():
+        match = build_match(query)
+        if not match:
+            return queryset.filter(barcode=query)
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        )
+    return queryset.filter(name__icontains=query)
+
+
+def prefix_filter(field, prefix):
+    """
+    Range lookup for values starting with `prefix`. Unlike LIKE 'x%' (which
+    SQLite only optimizes with a NOCASE column), a plain B-tree index serves it.
+    """
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'}
+
+
+def client_matches(query):
+    """Clients whose name (or phone, for numeric input) starts with `query`, None for empty input"""
+    query = (query or '').strip()
+    digits = Client.normalize_phone(query)
+    if len(digits) >= 3 and not re.search(r'[^\d\s()+-]', query):
+        return Client.objects.filter(**prefix_filter('phone_digits', digits)).order_by('phone_digits')
+    key = Client.normalize_name(query)
+    if not key:
+        return None
+    return Client.objects.filter(**prefix_filter('name_key', key)).order_by('name_key')
+
+
+def search_clients(query, limit=10):
+    matches = client_matches(query)
+    return [] if matches is None else list(matches[:limit])
+
+
+# Async variants for the HTMX search views
+
+async def asearch_clients(query, limit=10):
+    matches = client_matches(query)
+    return [] if matches is None else [client async for client in matches[:limit]]
+
+
+async def asearch_products(query, limit=20):
+    # The FTS query is raw SQL, which has no async API
+    return await sync_to_async(search_products)(query, limit)
@@ -0,0 +1,106 @@
+"""
+Cache for dashboard KPIs and report charts (the 'stats' cache in settings).
+
+Cached values are tied to the generation of the data they read:
+
+- SALES: Sale / SaleItem rows and the daily rollups built from them;
+- BALANCES: client balances (credit sales and payments).
+
+Signals on Sale, SaleItem and Payment replace the generation token of the
+topics they affect, so the next read misses and recomputes; nothing else
+is invalidated (a payment doesn't drop the report charts). Tokens are random
+rather than counters, so two writers bumping at once can't end up with the
+same token, and they are bumped again on commit so a value computed from
+data read mid-transaction isn't kept. Write paths that skip signals (bulk
+inserts, .update()) are always paired with a signal-sending write or call
+`invalidate()` directly.
+
+Keys include the database name, so the test database never reads values
+cached for the real one. Hit/miss counts are per process and exported at
+/metrics.
+"""
+import threading
+import uuid
+from collections import Counter
+
+from django.core.cache import caches
+from django.db import connection, transaction
+
+SALES = 'sales'
+BALANCES = 'balances'
+
+_counts = Counter()  # (name, 'hit' | 'miss') -> count
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches['stats']
+
+
+def _namespace():
+    return f"{connection.vendor}:{connection.settings_dict['NAME']}"
+
+
+def _generation_keys(topics):
+    return {f'{_namespace()}:gen:{topic}': topic for topic in topics}
+
+
+def invalidate(*topics):
+    _cache().set_many({key: uuid.uuid4().hex for key in _generation_keys(topics)}, timeout=None)
+
+
+def invalidate_on_commit(*topics):
+    invalidate(*topics)
+    transaction.on_commit(lambda: invalidate(*topics))
+
+
+def cached(name, topics, key_parts, compute):
+    """Value of compute() for key_parts, reused until one of `topics` changes"""
+    cache = _cache()
+    gen_keys = _generation_keys(topics)
+    generations = cache.get_many(list(gen_keys))
+    missing = {key: uuid.uuid4().hex for key in gen_keys if key not in generations}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        generations.update(missing)
+
+    key = ':'.join([_namespace(), name, *map(str, key_parts), *(generations[k] for k in sorted(gen_keys))])
+    value = cache.get(key)
+    with _lock:
+        _counts[(name, 'miss' if value is None else 'hit')] += 1
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
+
+
+def prometheus_lines():
+    with _lock:
+        counts = sorted(_counts.items())
+    lines = ['# HELP pos_stats_cache_requests_total Dashboard/report cache lookups', '# TYPE pos_stats_cache_requests_total counter']
+    for (name, result), count in counts:
+        lines.append(f'pos_stats_cache_requests_total{{cache="{name}",result="{result}"}} {count}')
+    return lines
+
+
+def reset_counts():
+    with _lock:
+        _counts.clear()
+
+
+# Signal receivers, connected in apps.py
+
+def sale_changed(sender, **kwargs):
+    invalidate_on_commit(SALES, BALANCES)
+
+
+def sale_item_changed(sender, **kwargs):
+    invalidate_on_commit(SALES)
+
+
+def payment_changed(sender, **kwargs):
+    invalidate_on_commit(BALANCES)
+
+
+def data_migrated(sender, **kwargs):
+    invalidate(SALES, BALANCES)
@@ -0,0 +1,65 @@
+"""
+Stock changes go through the StockMovement journal.
+
+`move()` appends the movements and applies them to Product.stock with a
+single `stock = stock + CASE ...` UPDATE in the same transaction, so
+concurrent registers never overwrite each other's counts (no
+read-modify-write). Absolute values (editing a product's stock) become an
+adjustment of the difference, read under a row lock.
+
+Products created through the ORM get their opening stock journaled by the
+post_save receiver (connected in apps.py); bulk inserts journal it
+themselves. `journal_totals()` is what `manage.py reconcile_stock` compares
+Product.stock against.
+"""
+from django.db import transaction
+from django.db.models import F, Sum, Case, When, Value
+
+from . import catalog
+from .models import Product, StockMovement
+
+
+def move(deltas, kind, sale=None, note=''):
+    """
+    Journal and apply {product_id: delta}. Three queries whatever the
+    number of products: movements INSERT, stock UPDATE, catalog change log.
+    """
+    deltas = {pid: delta for pid, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=pid, kind=kind, quantity=delta, sale=sale, note=note)
+            for pid, delta in deltas.items()
+        ])
+        Product.objects.filter(id__in=deltas).update(
+            stock=F('stock') + Case(*[When(id=pid, then=Value(delta)) for pid, delta in deltas.items()])
+        )
+        catalog.record_changes(deltas)
+
+
+def set_stock(product_id, stock, kind=StockMovement.ADJUSTMENT, note=''):
+    """Bring a product to `stock` units with one movement for the difference"""
+    with transaction.atomic():
+        current = Product.objects.select_for_update().values_list('stock', flat=True).get(pk=product_id)
+        move({product_id: stock - current}, kind, note=note)
+
+
+def journal_totals():
+    """{product_id: sum of its movements}, in one grouped query"""
+    return dict(
+        StockMovement.objects.values('product_id').annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+
+
+def product_created(sender, instance, created, raw=False, **kwargs):
+    """Opening movement for the stock a product is created with"""
+    if not created or raw:
+        return
+    # Views pass the POSTed string straight to create()
+    quantity = int(instance.stock or 0)
+    if quantity:
+        StockMovement.objects.create(
+            product=instance, kind=StockMovement.ADJUSTMENT, quantity=quantity, note='Stock inicial',
+        )
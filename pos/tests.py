@@ -1,3 +1,1181 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, Client as DjangoClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import cart, rollups, product_cache, metrics, stats_cache, search, catalog, product_import, stock
+from .benchmarks import generate_dataset
+from .models import (
+    Product, Client, Sale, SaleItem, Payment, StatementCheckpoint,
+    DailySalesSummary, DailyProductSummary, PdfRenderJob, StockMovement,
+)
+from .views import (
+    get_account_timeline, get_active_timeline, save_checkpoint, local_day_range,
+    statement_context, bulk_statement_contexts, record_sale,
+)
+
+# The stats cache is file based outside tests; keep it in process here
+# (whatever the runner) so tests don't write cache files
+stats_cache_in_memory = override_settings(CACHES={
+    **settings.CACHES,
+    'stats': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'TIMEOUT': 24 * 60 * 60},
+})
+
+
+def setUpModule():
+    stats_cache_in_memory.enable()
+
+
+def tearDownModule():
+    stats_cache_in_memory.disable()
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        self.user = User.objects.create_user('cajero', password='secret')
+        self.client.force_login(self.user)
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        self.products = [
+            Product.objects.create(name=f'Producto {i}', price=100 + i, stock=50)
+            for i in range(40)
+        ]
+
+    def fill_cart(self, products, quantity=2):
+        session = self.client.session
+        session['cart'] = {str(p.id): quantity for p in products}
+        session.save()
+
+    def checkout(self, payment_method='CASH'):
+        return self.client.post('/pos/checkout/', {
+            'client_id': self.customer.id,
+            'payment_method': payment_method,
+        })
+
+    def count_checkout_queries(self, products):
+        self.fill_cart(products)
+        with CaptureQueriesContext(connection) as ctx:
+            self.checkout()
+        return len(ctx.captured_queries)
+
+    def test_query_count_independent_of_cart_size(self):
+        one_line = self.count_checkout_queries(self.products[:1])
+        forty_lines = self.count_checkout_queries(self.products)
+        self.assertEqual(one_line, forty_lines)
+
+    def test_checkout_writes_items_stock_and_balance(self):
+        self.fill_cart(self.products[:3], quantity=4)
+        self.checkout(payment_method='CREDIT')
+
+        sale = Sale.objects.get()
+        self.assertEqual(sale.total, sum(p.price * 4 for p in self.products[:3]))
+        self.assertEqual(SaleItem.objects.filter(sale=sale).count(), 3)
+        for product in self.products[:3]:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 46)
+        self.products[3].refresh_from_db()
+        self.assertEqual(self.products[3].stock, 50)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.balance, sale.total)
+        self.assertEqual(self.client.session['cart'], {})
+
+    def test_cart_stores_quantities_and_prices_at_checkout(self):
+        product = self.products[0]
+        self.client.post('/pos/add-cart/', {'product_id': product.id, 'quantity': 2})
+        self.client.post('/pos/update-cart/', {'product_id': product.id, 'action': 'increment'})
+        self.assertEqual(self.client.session['cart'], {str(product.id): 3})
+
+        Product.objects.filter(pk=product.pk).update(price=1000)
+        self.checkout()
+        self.assertEqual(Sale.objects.get().total, 3000)
+
+    def test_cart_total_is_the_charged_total_after_a_price_edit(self):
+        product = self.products[0]
+        self.client.post('/pos/add-cart/', {'product_id': product.id, 'quantity': 2})
+        # Edited in another worker: this one's product cache isn't invalidated
+        Product.objects.filter(pk=product.pk).update(price=1000)
+        response = self.client.post('/pos/update-cart/', {'product_id': product.id, 'action': 'increment'})
+        self.assertEqual(response.context['cart_total'], 3000)
+        self.checkout()
+        self.assertEqual(Sale.objects.get().total, 3000)
+
+    def test_session_is_only_saved_when_the_cart_changes(self):
+        session = SessionStore()
+        for quantity in (0, -1):
+            cart.add(session, 7, quantity)
+        cart.remove(session, 7)
+        self.assertFalse(session.modified)
+        cart.add(session, 7, 2)
+        self.assertTrue(session.modified)
+        self.assertEqual(cart.get_cart(session), {7: 2})
+
+    def test_old_cart_format_is_converted(self):
+        product = self.products[0]
+        session = self.client.session
+        session['cart'] = {str(product.id): {'id': product.id, 'name': product.name, 'price': 1, 'quantity': 2}}
+        session.save()
+        response = self.client.get('/pos/')
+        self.assertEqual(response.context['cart_total'], product.price * 2)
+        self.checkout()
+        self.assertEqual(Sale.objects.get().total, product.price * 2)
+
+    def test_missing_product_aborts_without_writing(self):
+        self.fill_cart(self.products[:2])
+        self.products[1].delete()
+        self.checkout()
+        self.assertFalse(Sale.objects.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 50)
+
+
+class ClientBalanceTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        self.sale = Sale.objects.create(client=self.customer, payment_method='CREDIT', total=300)
+        Client.adjust_balance(self.customer.id, 300)
+
+    def balance(self, client):
+        client.refresh_from_db()
+        return client.balance
+
+    def test_payments_and_sale_moves_apply_deltas(self):
+        self.client.post(f'/clients/{self.customer.id}/payment/add/', {'amount': '50', 'note': ''})
+        self.assertEqual(self.balance(self.customer), 250)
+
+        other = Client.objects.create(name='Otro Cliente')
+        self.client.post(f'/invoice/edit/{self.sale.id}/', {'client_id': other.id, 'note': ''})
+        self.assertEqual((self.balance(self.customer), self.balance(other)), (-50, 300))
+        call_command('rebuild_balances', '--check', stdout=io.StringIO())
+
+    def test_edit_client_keeps_concurrent_balance_changes(self):
+        stale = Client.objects.get(pk=self.customer.pk)
+        Client.adjust_balance(self.customer.id, 100)  # e.g. a checkout between read and save
+        with mock.patch('pos.views.get_object_or_404', return_value=stale):
+            self.client.post(f'/clients/edit/{self.customer.id}/', {
+                'name': 'Nuevo Nombre', 'phone': '', 'email': '', 'address': '',
+            })
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.name, self.customer.balance), ('Nuevo Nombre', 400))
+
+    def add_client(self, name, initial_debt):
+        return self.client.post('/clients/add/', {
+            'name': name, 'phone': '', 'email': '', 'address': '', 'initial_debt': initial_debt,
+        })
+
+    def test_add_client_with_opening_debt_is_all_or_nothing(self):
+        self.add_client('Con Deuda', '70')
+        self.assertEqual(Client.objects.get(name='Con Deuda').balance, 70)
+
+        with mock.patch('pos.views.rollups.add_sale', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.add_client('Fallido', '70')
+        self.assertFalse(Client.objects.filter(name='Fallido').exists())
+
+    def test_rebuild_balances_check_detects_drift(self):
+        call_command('rebuild_balances', '--check', stdout=io.StringIO())
+        Client.objects.filter(pk=self.customer.pk).update(cached_balance=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_balances', '--check', stdout=io.StringIO())
+        self.assertEqual(self.balance(self.customer), 0)
+
+        call_command('rebuild_balances', stdout=io.StringIO())
+        self.assertEqual(self.balance(self.customer), 300)
+
+    def test_rebuild_keeps_a_payment_made_while_it_runs(self):
+        Client.objects.filter(pk=self.customer.pk).update(cached_balance=0)
+        customer = self.customer
+
+        class PaymentWhileReporting(io.StringIO):
+            # The drift report is written between computing and fixing the balances
+            def write(self, text):
+                if 'guardado=' in text:
+                    Payment.objects.create(client=customer, amount=40)
+                    Client.adjust_balance(customer.id, -40)
+                return super().write(text)
+
+        call_command('rebuild_balances', stdout=PaymentWhileReporting())
+        self.assertEqual(self.balance(self.customer), 260)
+        call_command('rebuild_balances', '--check', stdout=io.StringIO())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.products = Product.objects.bulk_create([Product(name=f'Producto {i}', price=1) for i in range(65)])
+        Client.objects.bulk_create([Client(name=f'Cliente {i}', phone='') for i in range(65)])
+        # Ties on created_at are broken by id
+        Client.objects.filter(name__in=['Cliente 10', 'Cliente 20', 'Cliente 30']).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+
+    def walk(self, url, rows):
+        """Ids of every row reached by following next_cursor, and the page sizes"""
+        ids, sizes, params = [], [], {}
+        while True:
+            response = self.client.get(url, params, HTTP_HX_REQUEST='true')
+            page = [row.id for row in response.context[rows]]
+            ids += page
+            sizes.append(len(page))
+            if not response.context['next_cursor']:
+                return ids, sizes
+            params = {'cursor': response.context['next_cursor']}
+
+    def test_pages_cover_every_row_once_in_order(self):
+        ids, sizes = self.walk('/inventory/', 'products')
+        self.assertEqual(sizes, [30, 30, 5])
+        self.assertEqual(ids, sorted((p.id for p in Product.objects.all()), reverse=True))
+
+        ids, sizes = self.walk('/clients/', 'clients')
+        self.assertEqual(sizes, [30, 30, 5])
+        expected = Client.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_last_full_page_has_no_next_cursor(self):
+        Product.objects.filter(name__in=[f'Producto {i}' for i in range(5)]).delete()
+        self.assertEqual(self.walk('/inventory/', 'products')[1], [30, 30])
+
+    def test_tampered_cursor_shows_first_page(self):
+        first = self.client.get('/inventory/', HTTP_HX_REQUEST='true').context['products']
+        for cursor in ['abc', '-5', '²', '9' * 30]:
+            response = self.client.get('/inventory/', {'cursor': cursor}, HTTP_HX_REQUEST='true')
+            self.assertEqual(response.status_code, 200, cursor)
+            self.assertEqual(response.context['products'], first, cursor)
+
+        first = self.client.get('/clients/', HTTP_HX_REQUEST='true').context['clients']
+        for cursor in ['abc', 'x~1', '2026-13-01T00:00:00+00:00~1', '2026-01-01T00:00:00~1',
+                       f'2026-01-01T00:00:00+00:00~{"9" * 30}']:
+            response = self.client.get('/clients/', {'cursor': cursor}, HTTP_HX_REQUEST='true')
+            self.assertEqual(response.status_code, 200, cursor)
+            self.assertEqual(response.context['clients'], first, cursor)
+
+
+class ScanBarcodeTests(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.product = Product.objects.create(name='Arroz Diana', price=100, barcode='7702')
+
+    def scan(self, code):
+        return self.client.post('/pos/scan/', {'barcode': code}, HTTP_HX_REQUEST='true')
+
+    def test_hit_adds_to_cart_and_is_cached(self):
+        self.scan('7702')
+        response = self.scan(' 7702 ')
+        self.assertContains(response, 'Arroz Diana')
+        self.assertEqual(self.client.session['cart'], {str(self.product.id): 2})
+        with self.assertNumQueries(0):
+            self.assertEqual(product_cache.lookup_barcode('7702').price, 100)
+
+    def test_miss_shows_search_results(self):
+        response = self.scan('arroz')
+        self.assertEqual(response['HX-Retarget'], '#pos-results')
+        self.assertContains(response, 'Arroz Diana')
+        self.assertNotIn('cart', self.client.session)
+
+    def test_edit_product_invalidates_barcode(self):
+        self.scan('7702')
+        self.client.post(f'/inventory/edit/{self.product.id}/', {'name': 'Arroz Diana', 'barcode': '7799', 'price': '150'})
+        self.assertEqual(self.scan('7702')['HX-Retarget'], '#pos-results')
+        self.scan('7799')
+        self.assertEqual(self.client.session['cart'], {str(self.product.id): 2})
+        self.assertEqual(product_cache.lookup_barcode('7799').price, 150)
+
+
+class OfflineSyncTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        self.product = Product.objects.create(name='Producto', price=100, stock=10)
+
+    def sync(self, sales):
+        response = self.client.post('/pos/sync/', json.dumps({'sales': sales}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def offline_sale(self, **overrides):
+        sale = {
+            'uuid': str(uuid.uuid4()),
+            'client_id': self.customer.id,
+            'payment_method': 'CREDIT',
+            'date': '2026-01-15T10:30:00Z',
+            'note': 'sin conexión',
+            'items': [{'product_id': self.product.id, 'quantity': 2}],
+        }
+        sale.update(overrides)
+        return sale
+
+    def test_resending_a_batch_does_not_duplicate_sales(self):
+        batch = [self.offline_sale(), self.offline_sale()]
+        first = self.sync(batch)
+        self.assertEqual([r['status'] for r in first], ['created', 'created'])
+
+        second = self.sync(batch)
+        self.assertEqual([r['status'] for r in second], ['duplicate', 'duplicate'])
+        self.assertEqual([r['sale_id'] for r in second], [r['sale_id'] for r in first])
+        self.assertEqual(Sale.objects.count(), 2)
+
+        self.product.refresh_from_db()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+        self.assertEqual(self.customer.balance, 400)
+        self.assertEqual(DailySalesSummary.objects.get().credit_total, 400)
+
+    def test_invalid_sales_are_rejected_without_blocking_the_batch(self):
+        good = self.offline_sale()
+        results = self.sync([
+            good,
+            self.offline_sale(items=[{'product_id': 999, 'quantity': 1}]),
+            self.offline_sale(payment_method='GRATIS'),
+            {'client_id': self.customer.id},
+        ])
+        self.assertEqual([r['status'] for r in results], ['created', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(results[0]['uuid'], good['uuid'])
+        self.assertEqual(Sale.objects.get().uuid, uuid.UUID(good['uuid']))
+
+    def test_bad_dates_reject_only_their_sale(self):
+        good = self.offline_sale()
+        results = self.sync([
+            self.offline_sale(date=1768473000),
+            self.offline_sale(date='2026-13-45T10:00:00'),
+            self.offline_sale(date='ayer'),
+            good,
+        ])
+        self.assertEqual([r['status'] for r in results], ['rejected'] * 3 + ['created'])
+        self.assertEqual({r.get('error') for r in results[:3]}, {'Fecha inválida'})
+        self.assertEqual(Sale.objects.get().uuid, uuid.UUID(good['uuid']))
+
+    def test_results_follow_the_order_of_the_batch(self):
+        repeated = self.offline_sale()
+        results = self.sync([
+            {'client_id': self.customer.id},
+            self.offline_sale(uuid='no-es-un-uuid'),
+            repeated,
+            'no es una venta',
+            repeated,
+        ])
+        self.assertEqual(len(results), 5)
+        self.assertEqual(
+            [r['status'] for r in results],
+            ['rejected', 'rejected', 'created', 'rejected', 'duplicate'],
+        )
+        self.assertEqual([r['uuid'] for r in results], [None, 'no-es-un-uuid', repeated['uuid'], None, repeated['uuid']])
+        self.assertEqual(results[4]['sale_id'], results[2]['sale_id'])
+        self.assertEqual(Sale.objects.count(), 1)
+
+
+class CatalogFeedTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        self.products = [Product.objects.create(name=f'Producto {i}', price=100, stock=10) for i in range(3)]
+
+    def get(self, **params):
+        response = self.client.get('/pos/catalog.json', params)
+        return response.json()
+
+    def test_delta_has_only_changes_since_version(self):
+        full = self.get()
+        self.assertEqual([row[0] for row in full['products']], [p.id for p in self.products])
+        version = full['version']
+        self.assertEqual(self.get(since=version)['products'], [])
+
+        # Stock moved by a checkout (bulk update), a deleted product
+        self.client.post('/pos/sync/', json.dumps({'sales': [{
+            'uuid': str(uuid.uuid4()), 'client_id': self.customer.id, 'payment_method': 'CASH',
+            'items': [{'product_id': self.products[0].id, 'quantity': 4}],
+        }]}), content_type='application/json')
+        deleted_id = self.products[2].id
+        self.products[2].delete()
+
+        delta = self.get(since=version)
+        stock = delta['fields'].index('stock')
+        self.assertEqual([(row[0], row[stock]) for row in delta['products']], [(self.products[0].id, 6)])
+        self.assertEqual(delta['deleted'], [deleted_id])
+        self.assertGreater(delta['version'], version)
+
+    def test_unchanged_catalog_answers_not_modified(self):
+        response = self.client.get('/pos/catalog.json', {'since': 0})
+        again = self.client.get('/pos/catalog.json', {'since': 0}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.products[0].save()
+        changed = self.client.get('/pos/catalog.json', {'since': 0}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    def test_client_list_is_versioned_like_the_catalog(self):
+        full = self.client.get('/pos/clients.json').json()
+        self.assertEqual(full['clients'], [[self.customer.id, 'Cliente Prueba']])
+        since = {'since': full['version']}
+        response = self.client.get('/pos/clients.json', since)
+        self.assertEqual(response.json()['clients'], [])
+        again = self.client.get('/pos/clients.json', since, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        # Balance changes don't touch the list; new and renamed clients do
+        Client.adjust_balance(self.customer.id, 500)
+        self.assertEqual(self.client.get('/pos/clients.json', since, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        other = Client.objects.create(name='Otro Cliente')
+        self.customer.name = 'Cliente Renombrado'
+        self.customer.save()
+        delta = self.client.get('/pos/clients.json', since).json()
+        self.assertEqual(delta['clients'], [[self.customer.id, 'Cliente Renombrado'], [other.id, 'Otro Cliente']])
+        other_id = other.id
+        other.delete()
+        self.assertEqual(self.client.get('/pos/clients.json', since).json()['deleted'], [other_id])
+
+
+class HtmxPartialTests(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.products = [Product.objects.create(name=f'Producto {i}', price=100, stock=10) for i in range(30)]
+
+    def search(self, **headers):
+        return self.client.get('/pos/search/', {'search': 'Producto'}, HTTP_HX_REQUEST='true', **headers)
+
+    def test_product_search_revalidates_with_catalog_version(self):
+        response = self.search()
+        self.assertIn('HX-Request', response['Vary'])
+        again = self.search(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.products[0].save()
+        changed = self.search(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+
+    async def test_async_search_views_under_asgi(self):
+        sale = await Sale.objects.acreate(client=await Client.objects.acreate(name='Ana Gómez'), total=0)
+        await self.async_client.aforce_login(await User.objects.aget(username='cajero'))
+        for url, params, text in [
+            ('/pos/search/', {'search': 'Producto 1'}, 'Producto 1'),
+            (f'/invoice/{sale.id}/search-products/', {'search': 'Producto 2'}, 'Producto 2'),
+            ('/clients/search/', {'search': 'ana'}, 'Ana Gómez'),
+        ]:
+            response = await self.async_client.get(url, params, headers={'HX-Request': 'true'})
+            self.assertContains(response, text)
+            # The metrics middleware also sees queries run by async views
+            self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    def test_partials_are_gzipped(self):
+        response = self.client.get('/inventory/', HTTP_HX_REQUEST='true', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Server-Timing', response)
+
+
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        self.products = [Product.objects.create(name=f'Producto {i}', price=100, stock=10) for i in range(2)]
+
+    def snapshot(self):
+        return (
+            sorted(DailySalesSummary.objects.filter(sale_count__gt=0).values_list(
+                'date', 'total', 'cash_total', 'credit_total', 'sale_count')),
+            sorted(DailyProductSummary.objects.exclude(quantity=0).values_list(
+                'date', 'product_id', 'quantity')),
+        )
+
+    def test_live_rollups_match_rebuild(self):
+        session = self.client.session
+        session['cart'] = {str(p.id): 2 for p in self.products}
+        session.save()
+        self.client.post('/pos/checkout/', {'client_id': self.customer.id, 'payment_method': 'CREDIT'})
+        sale = Sale.objects.get()
+
+        self.client.post(f'/invoice/{sale.id}/add-product/', {'product_id': self.products[0].id})
+        item = sale.items.get(product=self.products[1])
+        self.client.post(f'/invoice/{sale.id}/item/{item.id}/update/', {'action': 'remove'})
+        last_week = timezone.localtime() - timedelta(days=7)
+        self.client.post(f'/invoice/edit/{sale.id}/', {
+            'client_id': self.customer.id, 'note': '', 'date': last_week.strftime('%Y-%m-%dT%H:%M'),
+        })
+
+        live = self.snapshot()
+        self.assertEqual(live[0], [(last_week.date(), 300, 0, 300, 1)])
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), live)
+
+
+class StatementCheckpointTests(TestCase):
+    def setUp(self):
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        self.start = timezone.now() - timedelta(days=30)
+
+    def sale(self, day, total):
+        return Sale.objects.create(
+            client=self.customer, payment_method='CREDIT', total=total,
+            date=self.start + timedelta(days=day),
+        )
+
+    def payment(self, day, amount):
+        payment = Payment.objects.create(client=self.customer, amount=amount, note='')
+        Payment.objects.filter(pk=payment.pk).update(date=self.start + timedelta(days=day))
+
+    def full_active_timeline(self):
+        timeline, cutoff_index = get_account_timeline(self.customer)
+        return timeline[cutoff_index+1:]
+
+    def active_timeline(self):
+        return get_active_timeline(self.customer, persist=True)[0]
+
+    def test_active_timeline_matches_full_scan(self):
+        self.sale(1, 500)
+        self.payment(2, 500)
+        self.sale(3, 200)
+        self.sale(4, 300)
+        self.payment(5, 100)
+
+        active = self.active_timeline()
+        checkpoint = StatementCheckpoint.objects.get(client=self.customer)
+        self.assertEqual(checkpoint.date, self.start + timedelta(days=2))
+        self.assertEqual([e['balance'] for e in active], [200, 500, 400])
+        self.assertEqual(
+            [e['key'] for e in active],
+            [e['key'] for e in self.full_active_timeline()],
+        )
+
+    def test_checkpoint_moves_forward_and_is_invalidated_by_backdated_events(self):
+        self.sale(1, 500)
+        self.payment(2, 500)
+        self.active_timeline()
+
+        self.sale(3, 200)
+        self.payment(4, 200)
+        self.sale(5, 50)
+        self.assertEqual([e['balance'] for e in self.active_timeline()], [50])
+        self.assertEqual(
+            StatementCheckpoint.objects.get(client=self.customer).date,
+            self.start + timedelta(days=4),
+        )
+
+        # A sale dated before the checkpoint reopens the settled period
+        self.sale(0, 100)
+        StatementCheckpoint.invalidate(self.customer.id, self.start)
+        self.assertFalse(StatementCheckpoint.objects.filter(client=self.customer).exists())
+        active = self.active_timeline()
+        self.assertEqual(
+            [e['key'] for e in active],
+            [e['key'] for e in self.full_active_timeline()],
+        )
+
+    def test_bulk_contexts_match_per_client_statements(self):
+        other = Client.objects.create(name='Otro Cliente')
+        self.sale(1, 500)
+        self.payment(2, 500)
+        self.sale(3, 200)
+        Sale.objects.create(client=other, payment_method='CREDIT', total=70, date=self.start)
+        self.active_timeline()  # stores a checkpoint for self.customer
+
+        clients = Client.objects.order_by('id')
+        with self.assertNumQueries(5):  # clients, sales, items, payments, checkpoints
+            bulk = list(bulk_statement_contexts(clients))
+        for context in bulk:
+            single = statement_context(context['client'])
+            self.assertEqual(
+                [e['key'] for e in context['timeline']],
+                [e['key'] for e in single['timeline']],
+            )
+            self.assertEqual(context['current_debt'], single['current_debt'])
+
+        StatementCheckpoint.objects.all().delete()
+        list(bulk_statement_contexts(clients, persist=True))
+        self.assertEqual(StatementCheckpoint.objects.get().date, self.start + timedelta(days=2))
+
+    def test_only_staff_pages_store_checkpoints(self):
+        self.sale(1, 500)
+        self.payment(2, 500)
+        self.sale(3, 200)
+        response = self.client.get(f'/client/{self.customer.id}/public-statement/')
+        self.assertEqual(response.context['current_debt'], 200)
+        self.assertFalse(StatementCheckpoint.objects.exists())
+
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.client.get(f'/clients/{self.customer.id}/statement/')
+        self.assertTrue(StatementCheckpoint.objects.filter(client=self.customer).exists())
+
+    def test_stale_zero_point_is_not_stored(self):
+        self.sale(1, 500)
+        self.payment(2, 500)
+        timeline, cutoff_index = get_account_timeline(self.customer)
+        # Saved between reading the timeline and storing its zero point
+        self.sale(0, 100)
+        StatementCheckpoint.invalidate(self.customer.id, self.start)
+
+        self.assertIsNone(save_checkpoint(self.customer.id, timeline[cutoff_index]['key']))
+        self.assertFalse(StatementCheckpoint.objects.exists())
+        self.assertEqual([e['balance'] for e in self.active_timeline()], [100, 600, 100])
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Each page runs a fixed number of queries, whatever the amount of
+    sales, items and payments behind it. Budgets include the session and
+    user lookups done by the auth middleware.
+    """
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Cliente Prueba')
+
+    def add_history(self, sales):
+        products = [Product.objects.create(name=f'Producto {i}', price=10) for i in range(3)]
+        for _ in range(sales):
+            sale = Sale.objects.create(client=self.customer, payment_method='CREDIT', total=30)
+            SaleItem.objects.bulk_create([
+                SaleItem(sale=sale, product=p, quantity=1, price=10) for p in products
+            ])
+            Payment.objects.create(client=self.customer, amount=10, note='')
+        return sale
+
+    def assert_budgets(self, sale):
+        budgets = [
+            (f'/invoice/{sale.id}/', 5),
+            (f'/invoice/edit/{sale.id}/', 5),
+            (f'/clients/{self.customer.id}/statement/', 8),
+            (f'/client/{self.customer.id}/public-statement/', 6),
+            ('/reports/', 5),
+            ('/', 5),
+            ('/clients/', 3),
+            ('/inventory/', 3),
+        ]
+        for url, budget in budgets:
+            with self.subTest(url=url), self.assertNumQueries(budget):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_small_history(self):
+        self.assert_budgets(self.add_history(2))
+
+    def test_large_history(self):
+        self.assert_budgets(self.add_history(25))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class IndexUsageTests(TestCase):
+    """The date filters of the dashboard, reports and statements hit an index"""
+
+    def assert_uses_index(self, queryset, index_name=None):
+        plan = queryset.explain()
+        self.assertIn('USING', plan)
+        self.assertNotRegex(plan, r'SCAN pos_(sale|payment|daily\w+)\b')
+        if index_name:
+            self.assertIn(index_name, plan)
+
+    def test_report_date_range(self):
+        today = timezone.localdate()
+        start, end = local_day_range(today - timedelta(days=30), today)
+        self.assert_uses_index(
+            Sale.objects.filter(date__gte=start, date__lt=end).order_by('-date'),
+            'sale_date_idx',
+        )
+        self.assert_uses_index(
+            Sale.objects.filter(payment_method='CREDIT', date__gte=start, date__lt=end),
+            'sale_method_date_idx',
+        )
+
+    def test_local_day_range_is_half_open_in_local_time(self):
+        day = timezone.localdate()
+        start, end = local_day_range(day, day)
+        self.assertEqual(timezone.localtime(start).date(), day)
+        self.assertEqual(timezone.localtime(start).hour, 0)
+        self.assertEqual(end - start, timedelta(days=1))
+
+    def test_dashboard_and_report_rollups(self):
+        today = timezone.localdate()
+        self.assert_uses_index(DailySalesSummary.objects.filter(date__gte=today.replace(day=1), date__lte=today))
+        self.assert_uses_index(DailySalesSummary.objects.filter(date=today))
+        self.assert_uses_index(
+            DailyProductSummary.objects.filter(date__gte=today - timedelta(days=30), date__lte=today)
+            .values('product__name').annotate(total_qty=Sum('quantity'))
+        )
+
+    def test_statement_queries(self):
+        self.assert_uses_index(
+            Sale.objects.filter(client_id=1, payment_method='CREDIT').order_by('date', 'id'),
+            'sale_client_date_idx',
+        )
+        self.assert_uses_index(
+            Payment.objects.filter(client_id=1).order_by('date', 'id'),
+            'payment_client_date_idx',
+        )
+
+    def test_client_lookups(self):
+        self.assert_uses_index(
+            Client.objects.filter(**search.prefix_filter('name_key', 'ana')).order_by('name_key'),
+            'client_name_key_idx',
+        )
+        self.assert_uses_index(Client.objects.filter(phone_digits='3001234567'), 'client_phone_digits_idx')
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.cafe = Product.objects.create(name='Café Águila Roja 500g', price=1, barcode='7701')
+        self.arroz = Product.objects.create(name='Arroz Diana 1000g', price=1, barcode='7702')
+        self.coded = Product.objects.create(name='Leche 7701 Colanta', price=1, barcode='9900')
+
+    def names(self, query):
+        return [p.name for p in search.search_products(query)]
+
+    def test_prefix_accent_insensitive_and_barcode_first(self):
+        if not search.fts_enabled():
+            self.skipTest('SQLite without FTS5')
+        self.assertEqual(self.names('arr'), ['Arroz Diana 1000g'])
+        self.assertEqual(self.names('CAFE agui'), ['Café Águila Roja 500g'])
+        self.assertEqual(self.names('aguila'), ['Café Águila Roja 500g'])
+        self.assertEqual(self.names('7701'), ['Café Águila Roja 500g', 'Leche 7701 Colanta'])
+        self.assertEqual(self.names('frijol'), [])
+        self.assertEqual(len(search.search_products('a', limit=1)), 1)
+        self.assertEqual(self.names('"*'), [])
+        # The index follows writes that skip model signals
+        Product.objects.filter(pk=self.arroz.pk).update(name='Fríjol Diana')
+        self.assertEqual((self.names('arr'), self.names('frij')), ([], ['Fríjol Diana']))
+        self.arroz.delete()
+        self.assertEqual(self.names('frij'), [])
+
+    def test_best_match_wins_over_newer_products(self):
+        if not search.fts_enabled():
+            self.skipTest('SQLite without FTS5')
+        best = Product.objects.create(name='Arroz', price=1)
+        # More newer, weaker matches than any cap on the candidates would keep
+        Product.objects.bulk_create(
+            Product(name=f'Arroz Roa Premium Grano Largo {i} 500g', price=1) for i in range(1500)
+        )
+        self.assertEqual(search.search_products('arr', limit=2), [best, self.arroz])
+
+    def test_icontains_fallback_without_index(self):
+        with mock.patch('pos.search.fts_enabled', return_value=False):
+            self.assertEqual(self.names('arr'), ['Arroz Diana 1000g'])
+            self.assertEqual(self.names('7701'), ['Café Águila Roja 500g', 'Leche 7701 Colanta'])
+            self.assertEqual(list(search.filter_products(Product.objects.order_by('id'), 'diana')), [self.arroz])
+            self.assertEqual(len(search.search_products('0', limit=2)), 2)
+
+
+class ClientSearchTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.ana = Client.objects.create(name='Ana Gómez', phone='300 123-4567')
+        self.andres = Client.objects.create(name='Andrés López', phone='(310) 555 0000')
+
+    def test_name_prefix_ignores_case_and_accents(self):
+        self.assertEqual(search.search_clients('AND'), [self.andres])
+        self.assertEqual(search.search_clients('ana gom'), [self.ana])
+        self.assertEqual(search.search_clients('an'), [self.ana, self.andres])
+
+    def test_phone_prefix_ignores_formatting(self):
+        self.assertEqual(search.search_clients('300-12'), [self.ana])
+        response = self.client.get('/clients/search/', {'client_search_display': '310555'})
+        self.assertContains(response, 'Andrés López')
+
+    def test_public_debt_check_matches_normalized_phone(self):
+        response = self.client.post('/public/check/', {'phone': '3001234567'})
+        self.assertContains(response, 'Ana Gómez')
+
+
+class CsvExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Ana Gómez')
+        self.product = Product.objects.create(name='Café Águila', price=10, barcode='7701')
+        self.today = timezone.localdate()
+        self.old = self.sale(40, 'CREDIT', 2)
+        self.recent = self.sale(1, 'CREDIT', 5)
+        self.cash = self.sale(0, 'CASH', 1)
+        Payment.objects.create(client=self.customer, amount=30, note='abono')
+        Client.adjust_balance(self.customer.id, 70 - 30)
+
+    def sale(self, days_ago, payment_method, quantity):
+        sale = Sale.objects.create(
+            client=self.customer, payment_method=payment_method, total=10 * quantity,
+            date=timezone.now() - timedelta(days=days_ago),
+        )
+        SaleItem.objects.create(sale=sale, product=self.product, quantity=quantity, price=10)
+        return sale
+
+    def rows(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('\ufeff'))
+        return list(csv.reader(io.StringIO(body[1:])))
+
+    def test_sales_and_items_within_date_range(self):
+        header, *rows = self.rows('/reports/export/sales.csv')
+        self.assertEqual(header, ['Factura', 'Fecha', 'Cliente', 'Método', 'Total', 'Nota'])
+        self.assertEqual([int(row[0]) for row in rows], [self.cash.id, self.recent.id])
+        self.assertEqual(rows[1][2:5], ['Ana Gómez', 'CREDIT', '50'])
+
+        start = (self.today - timedelta(days=45)).isoformat()
+        end = (self.today - timedelta(days=30)).isoformat()
+        _, *rows = self.rows('/reports/export/sales.csv', {'date_start': start, 'date_end': end})
+        self.assertEqual([int(row[0]) for row in rows], [self.old.id])
+
+        header, *rows = self.rows('/reports/export/items.csv', {'date_start': start})
+        self.assertEqual(header[3:], ['Producto', 'Código', 'Cantidad', 'Precio', 'Subtotal'])
+        self.assertEqual(
+            [row[:1] + row[3:] for row in rows],
+            [[str(sale.id), 'Café Águila', '7701', str(q), '10', str(10 * q)]
+             for sale, q in [(self.cash, 1), (self.recent, 5), (self.old, 2)]],
+        )
+
+    def test_statement_running_balance_ends_at_cached_balance(self):
+        header, *rows = self.rows(f'/clients/{self.customer.id}/statement/csv/')
+        self.assertEqual(header, ['Fecha', 'Movimiento', 'Cargo', 'Abono', 'Saldo', 'Nota'])
+        self.assertEqual(
+            [row[1:5] for row in rows],
+            [[f'Factura #{self.old.id}', '20', '0', '20'],
+             [f'Factura #{self.recent.id}', '50', '0', '70'],
+             ['abono', '0', '30', '40']],
+        )
+        self.customer.refresh_from_db()
+        self.assertEqual(int(rows[-1][4]), self.customer.cached_balance)
+
+    async def test_exports_stream_asynchronously_under_asgi(self):
+        # A sync iterator would be read whole into memory by the ASGI handler
+        await self.async_client.aforce_login(await User.objects.aget(username='cajero'))
+        for url in ['/reports/export/sales.csv', f'/clients/{self.customer.id}/statement/csv/']:
+            response = await self.async_client.get(url)
+            self.assertTrue(response.is_async)
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+            expected = await sync_to_async(self.rows)(url)
+            self.assertEqual(list(csv.reader(io.StringIO(body[1:]))), expected)
+
+
+class StatementPdfTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        Sale.objects.create(client=self.customer, payment_method='CREDIT', total=500)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=tmp.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.url = f'/clients/{self.customer.id}/statement/pdf/'
+
+    def test_pdf_is_queued_rendered_once_and_served_from_cache(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Generando PDF')
+        self.client.get(self.url)
+        self.assertEqual(PdfRenderJob.objects.get().status, PdfRenderJob.PENDING)
+
+        call_command('pdf_worker', once=True, workers=1, stdout=io.StringIO())
+        # Served from disk from now on, so the job and its HTML are gone
+        self.assertFalse(PdfRenderJob.objects.exists())
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        # A new payment changes the statement, so a new render is queued
+        Payment.objects.create(client=self.customer, amount=100, note='')
+        self.assertContains(self.client.get(self.url), 'Generando PDF')
+        self.assertEqual(PdfRenderJob.objects.filter(status=PdfRenderJob.PENDING).count(), 1)
+
+    def test_polling_a_queued_pdf_does_not_render_the_html(self):
+        self.client.get(self.url)
+        with mock.patch('pos.views.get_template') as get_template:
+            self.assertContains(self.client.get(self.url), 'Generando PDF')
+        get_template.assert_not_called()
+
+    def test_worker_requeues_only_stale_jobs_and_prunes_old_failures(self):
+        now = timezone.now()
+        for key, status, age in [
+            ('recent', PdfRenderJob.RUNNING, timedelta(seconds=10)),
+            ('stale', PdfRenderJob.RUNNING, timedelta(minutes=10)),
+            ('failed-old', PdfRenderJob.FAILED, timedelta(days=2)),
+            ('failed-new', PdfRenderJob.FAILED, timedelta(hours=1)),
+        ]:
+            job = PdfRenderJob.objects.create(client=self.customer, cache_key=key, html='<p>x</p>', status=status)
+            PdfRenderJob.objects.filter(pk=job.pk).update(updated_at=now - age)
+
+        # Another worker is still rendering 'recent'; 'stale' was abandoned
+        with mock.patch('pos.management.commands.pdf_worker.Command.claim_jobs', return_value=[]):
+            call_command('pdf_worker', once=True, workers=1, stdout=io.StringIO())
+        self.assertEqual(
+            dict(PdfRenderJob.objects.values_list('cache_key', 'status')),
+            {'recent': PdfRenderJob.RUNNING, 'stale': PdfRenderJob.PENDING, 'failed-new': PdfRenderJob.FAILED},
+        )
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.existing = Product.objects.create(name='Arroz Viejo', barcode='770001', price=1000, stock=5)
+
+    def test_upsert_by_barcode_with_row_errors(self):
+        version = catalog.current_version()
+        csv_text = (
+            'codigo;nombre;precio;stock\n'
+            '770001;Arroz Diana 500g;2.500;8\n'
+            '770002;Café Sello Rojo;9000;12\n'
+            '770003;Sin Precio;;3\n'
+            ';Sin Código;100;1\n'
+        )
+        result = product_import.import_products(io.StringIO(csv_text), chunk_size=2)
+        self.assertEqual((result['rows'], result['created'], result['updated']), (4, 1, 1))
+        self.assertEqual([line for line, _ in result['errors']], [4, 5])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price, self.existing.stock), ('Arroz Diana 500g', 2500, 8))
+        self.assertEqual(stock.journal_totals()[self.existing.id], 8)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual([p.name for p in search.search_products('cafe')], ['Café Sello Rojo'])
+        changed = catalog.changes_since(version)['products']
+        self.assertEqual(len(changed), 2)
+
+    def test_upload_view_updates_only_given_columns(self):
+        upload = SimpleUploadedFile('precios.csv', 'barcode,price\n770001,1200\n770009,50\n'.encode())
+        response = self.client.post('/inventory/import/', {'file': upload})
+        self.assertRedirects(response, '/inventory/')
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price, self.existing.stock), ('Arroz Viejo', 1200, 5))
+        self.assertFalse(Product.objects.filter(barcode='770009').exists())
+
+
+class StockJournalTests(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        self.product = Product.objects.create(name='Arroz', price=100, stock=10)
+        self.other = Product.objects.create(name='Café', price=300, stock=4)
+
+    def test_every_write_path_is_journaled(self):
+        session = self.client.session
+        session['cart'] = {str(self.product.id): 3, str(self.other.id): 1}
+        session.save()
+        self.client.post('/pos/checkout/', {'client_id': self.customer.id, 'payment_method': 'CASH'})
+        sale = Sale.objects.get()
+        self.client.post(f'/inventory/add-stock/{self.product.id}/', {'quantity': 5})
+        self.client.post(f'/invoice/{sale.id}/add-product/', {'product_id': self.product.id})
+        item = sale.items.get(product=self.other)
+        self.client.post(f'/invoice/{sale.id}/item/{item.id}/update/', {'action': 'remove'})
+        self.client.post(f'/inventory/edit/{self.other.id}/', {'name': 'Café', 'price': 300, 'stock': 20})
+
+        self.product.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.product.stock, self.other.stock), (10 - 3 + 5 - 1, 20))
+        self.assertEqual(stock.journal_totals(), {self.product.id: 11, self.other.id: 20})
+        kinds = StockMovement.objects.filter(product=self.other).values_list('kind', 'quantity')
+        self.assertEqual(sorted(kinds), [('ADJUSTMENT', 4), ('ADJUSTMENT', 16), ('EDIT', 1), ('SALE', -1)])
+        call_command('reconcile_stock', '--check', stdout=io.StringIO())
+
+    def test_reconcile_restores_stock_from_journal(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=999)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stock', '--check', stdout=io.StringIO())
+        call_command('reconcile_stock', stdout=io.StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+
+@skipUnless(
+    connection.features.test_db_allows_multiple_connections or connection.settings_dict['TEST'].get('NAME'),
+    'Needs a test database shared between threads (PostgreSQL, or SQLite with a TEST NAME file)',
+)
+class ConcurrentSaleEditTests(TransactionTestCase):
+    """Parallel edits of one invoice keep its total, stock and balance consistent"""
+
+    def test_parallel_item_edits(self):
+        user = User.objects.create_user('cajero', password='secret')
+        customer = Client.objects.create(name='Cliente Prueba')
+        products = [Product.objects.create(name=f'Producto {i}', price=100 * (i + 1), stock=100) for i in range(3)]
+        sale = record_sale(customer, 'CREDIT', {products[0].id: 5}, {products[0].id: 100}, timezone.now(), '')
+        item = sale.items.get()
+        errors = []
+
+        def edit(actions):
+            http = DjangoClient()
+            http.force_login(user)
+            try:
+                for url, data in actions:
+                    response = http.post(url, data)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        add = f'/invoice/{sale.id}/add-product/'
+        update = f'/invoice/{sale.id}/item/{item.id}/update/'
+        workers = [
+            # Two registers adding the same new product must end on one line
+            [(add, {'product_id': products[1].id})] * 5,
+            [(add, {'product_id': products[1].id})] * 5,
+            [(add, {'product_id': products[2].id})] * 10,
+            [(update, {'action': 'increment'})] * 10,
+            # Never down to the last unit, which would delete the line
+            [(update, {'action': 'decrement'})] * 4,
+        ]
+        threads = [threading.Thread(target=edit, args=(actions,)) for actions in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        sale.refresh_from_db()
+        customer.refresh_from_db()
+        lines = SaleItem.objects.filter(sale=sale)
+        self.assertEqual(sale.total, sum(line.subtotal for line in lines))
+        self.assertEqual(sale.total, 11 * 100 + 10 * 200 + 10 * 300)
+        self.assertEqual(lines.count(), 3)
+        self.assertEqual(customer.cached_balance, sale.total)
+        sold = dict(lines.values_list('product_id').annotate(n=Sum('quantity')))
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 100 - sold.get(product.id, 0))
+        self.assertEqual(stock.journal_totals(), {p.id: p.stock for p in products})
+
+    def test_header_edit_keeps_concurrent_item_changes(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        customer = Client.objects.create(name='Cliente Prueba')
+        other = Client.objects.create(name='Otro Cliente')
+        product = Product.objects.create(name='Producto', price=100, stock=100)
+        sale = record_sale(customer, 'CREDIT', {product.id: 1}, {product.id: 100}, timezone.now(), '')
+        stale = Sale.objects.get(pk=sale.pk)
+        self.client.post(f'/invoice/{sale.id}/add-product/', {'product_id': product.id})
+
+        def lookup(model, **kwargs):
+            return stale if model is not Client else Client.objects.get(**kwargs)
+
+        with mock.patch('pos.views.get_object_or_404', side_effect=lookup):
+            self.client.post(f'/invoice/edit/{sale.id}/', {'client_id': other.id, 'note': 'movida'})
+        sale.refresh_from_db()
+        customer.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((sale.client_id, sale.note, sale.total), (other.id, 'movida', 200))
+        self.assertEqual((customer.cached_balance, other.cached_balance), (0, 200))
+
+
+@skipUnless(
+    connection.features.test_db_allows_multiple_connections or connection.settings_dict['TEST'].get('NAME'),
+    'Needs a test database shared between threads (PostgreSQL, or SQLite with a TEST NAME file)',
+)
+class CatalogVersionTests(TransactionTestCase):
+    def test_change_committed_late_is_not_skipped(self):
+        first, second = [Product.objects.create(name=f'Producto {i}', price=100) for i in range(2)]
+        seen = catalog.current_version()
+        recorded, release = threading.Event(), threading.Event()
+        second_done = threading.Event()
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    catalog.record_changes([first.id])
+                    recorded.set()
+                    release.wait(5)
+            finally:
+                connections.close_all()
+
+        def fast_writer():
+            try:
+                catalog.record_changes([second.id])
+                second_done.set()
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=slow_writer)]
+        threads[0].start()
+        recorded.wait(5)
+        threads.append(threading.Thread(target=fast_writer))
+        threads[1].start()
+        # The second writer can't commit a newer version while the first is open
+        self.assertFalse(second_done.wait(0.5))
+        # A terminal syncing now gets a version that doesn't cover either change
+        delta = catalog.changes_since(seen)
+        self.assertEqual((delta['version'], delta['products']), (seen, []))
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        changed = [row[0] for row in catalog.changes_since(delta['version'])['products']]
+        self.assertEqual(changed, [first.id, second.id])
+
+
+class BenchmarkDatasetTests(TestCase):
+    def test_generated_data_is_consistent(self):
+        sizes = generate_dataset(seed=3, products=30, clients=10, days=20, sales_per_day=6)
+        self.assertEqual(Sale.objects.count(), sizes['sales'])
+        for customer in Client.objects.all():
+            self.assertEqual(customer.cached_balance, customer.compute_balance())
+        call_command('reconcile_stock', '--check', stdout=io.StringIO())
+        live = list(DailySalesSummary.objects.order_by('date').values_list('date', 'total'))
+        rollups.rebuild()
+        self.assertEqual(list(DailySalesSummary.objects.order_by('date').values_list('date', 'total')), live)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.user = User.objects.create_user('cajero', password='secret')
+        self.client.force_login(self.user)
+
+    def test_server_timing_and_staff_only_metrics(self):
+        response = self.client.get('/inventory/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", total;dur=')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('pos_request_queries_count{view="inventory"} 1', text)
+        self.assertIn('pos_request_n_plus_one_total{view="inventory"} 0', text)
+
+    def test_repeated_queries_are_flagged(self):
+        recorder = metrics.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for i in range(6):
+                list(Product.objects.filter(id=i + 1))
+            list(Product.objects.filter(id__in=[1, 2, 3]))
+            list(Product.objects.filter(id__in=[4, 5]))
+        self.assertEqual(sorted(recorder.shapes.values()), [2, 6])
+
+
+class StatsCacheTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('cajero', password='secret'))
+        self.customer = Client.objects.create(name='Cliente Prueba')
+        stats_cache.reset_counts()
+
+    def counts(self):
+        return dict(stats_cache._counts)
+
+    def test_dashboard_and_reports_are_reused_until_their_data_changes(self):
+        self.client.get('/')
+        self.client.get('/reports/')
+        with self.assertNumQueries(2):  # session and user only
+            self.client.get('/')
+
+        # A payment changes balances: the dashboard recomputes, the report doesn't
+        Payment.objects.create(client=self.customer, amount=100, note='')
+        self.client.get('/')
+        self.client.get('/reports/')
+        self.assertEqual(self.counts(), {
+            ('dashboard', 'miss'): 2, ('dashboard', 'hit'): 1,
+            ('report', 'miss'): 1, ('report', 'hit'): 1,
+        })
+
+        # A sale changes both
+        Sale.objects.create(client=self.customer, payment_method='CASH', total=50)
+        rollups.add_sale(timezone.now(), 'CASH', 50)
+        response = self.client.get('/reports/')
+        self.assertEqual(response.context['total_period'], 50)
+        self.assertEqual(self.client.get('/').context['today_sales'], 50)
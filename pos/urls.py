@@ -6,8 +6,12 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('inventory/', views.inventory, name='inventory'),
     path('reports/', views.report_analytics, name='reports'),
+    path('reports/export/sales.csv', views.export_sales_csv, name='export_sales_csv'),
+    path('reports/export/items.csv', views.export_sale_items_csv, name='export_sale_items_csv'),
     path('clients/', views.clients, name='clients'),
     path('clients/<int:client_id>/statement/', views.client_statement, name='client_statement'),
+    path('clients/<int:client_id>/statement/history/', views.client_statement_history, name='client_statement_history'),
+    path('clients/<int:client_id>/statement/csv/', views.export_client_statement_csv, name='export_client_statement_csv'),
     path('clients/<int:client_id>/statement/pdf/', views.client_statement_pdf, name='client_statement_pdf'),
     path('clients/<int:client_id>/payment/add/', views.add_payment, name='add_payment'),
     path('pos/', views.pos, name='pos'),
@@ -15,11 +19,16 @@ urlpatterns = [
     # HTMX Partials
     path('pos/search/', views.search_products, name='search_products'),
     path('pos/add-cart/', views.add_to_cart, name='add_to_cart'),
+    path('pos/scan/', views.scan_barcode, name='scan_barcode'),
     path('pos/update-cart/', views.update_cart_item, name='update_cart_item'),
     path('pos/clear-cart/', views.clear_cart, name='clear_cart'),
     path('pos/checkout/', views.checkout, name='checkout'),
+    path('pos/catalog.json', views.pos_catalog, name='pos_catalog'),
+    path('pos/clients.json', views.pos_clients, name='pos_clients'),
+    path('pos/sync/', views.sync_sales, name='sync_sales'),
     path('invoice/<int:sale_id>/', views.invoice_detail, name='invoice_detail'),
     path('inventory/add/', views.add_product, name='add_product'),
+    path('inventory/import/', views.import_products, name='import_products'),
     path('clients/search/', views.search_clients, name='search_clients'),
     path('clients/add/', views.add_client, name='add_client'),
     
@@ -31,6 +40,7 @@ urlpatterns = [
     path('client/<int:client_id>/public-statement/', views.client_public_statement, name='client_public_statement'),
     path('sw.js', views.service_worker, name='service_worker'),
     path('manifest.json', views.manifest, name='manifest'),
+    path('metrics', views.metrics, name='metrics'),
     path('inventory/edit/<int:product_id>/', views.edit_product, name='edit_product'),
     path('inventory/add-stock/<int:product_id>/', views.add_stock, name='add_stock'),
     path('clients/edit/<int:client_id>/', views.edit_client, name='edit_client'),
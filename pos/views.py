@@ -1,93 +1,234 @@
+import csv
+import hashlib
+import heapq
+import hmac
+import io
+import itertools
+import json
+from functools import wraps
+from uuid import UUID
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Sum, Q, F
+from django.db import transaction, IntegrityError
+from django.db.models import Sum, Q, F, prefetch_related_objects
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib import messages
-from django.http import HttpResponse
-from .models import Product, Client, Sale, SaleItem, Payment
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse, Http404, JsonResponse
+from django_htmx.http import retarget
+from .models import (
+    Product, Client, Sale, SaleItem, Payment, StatementCheckpoint,
+    DailySalesSummary, DailyProductSummary, PdfRenderJob, StockMovement,
+)
+from . import (
+    search, product_cache, product_import, rollups, pdf, cart, catalog, stats_cache, stock,
+    metrics as request_metrics,
+)
 from django.template.loader import get_template
-from xhtml2pdf import pisa
 
 from django.contrib.auth.decorators import login_required
-
-# Helper for cart
-def get_cart_data(session):
-    cart = session.get('cart', {})
-    cart_items = []
-    total = 0
-    for parsed_id, item in cart.items():
-        subtotal = item['quantity'] * item['price']
-        total += subtotal
-        # item is a dict, we can add subtotal for display
-        item['subtotal'] = subtotal 
-        cart_items.append(item)
-    return cart_items, total
+from django.views.decorators.cache import cache_control
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 
 @login_required
 def dashboard(request):
-    now = timezone.now()
-    # Monthly sales (current month)
-    monthly_sales = Sale.objects.filter(
-        date__year=now.year,
-        date__month=now.month
+    today = timezone.localdate()
+    context = stats_cache.cached(
+        'dashboard', [stats_cache.SALES, stats_cache.BALANCES], [today],
+        lambda: dashboard_kpis(today),
+    )
+    return render(request, 'pos/dashboard.html', context)
+
+def dashboard_kpis(today):
+    # Monthly and daily sales come from the daily rollup (at most ~31 rows)
+    monthly_sales = DailySalesSummary.objects.filter(
+        date__gte=today.replace(day=1),
+        date__lte=today
     ).aggregate(Sum('total'))['total__sum'] or 0
     
-    today_sales = Sale.objects.filter(date__date=now.date()).aggregate(Sum('total'))['total__sum'] or 0
+    today_sales = DailySalesSummary.objects.filter(date=today).aggregate(Sum('total'))['total__sum'] or 0
     
-    # Calculate detailed debt: Sum of (Credit Sales Total) - Sum of (All Payments)
-    # This ensures the portfolio decreases as clients make payments
-    total_credit_sales = Sale.objects.filter(payment_method='CREDIT').aggregate(Sum('total'))['total__sum'] or 0
-    total_payments = Payment.objects.aggregate(Sum('amount'))['amount__sum'] or 0
-    debt_pending = total_credit_sales - total_payments
+    # Detailed debt: Sum of (Credit Sales Total) - Sum of (All Payments),
+    # which is the sum of the clients' cached balances
+    debt_pending = Client.objects.aggregate(Sum('cached_balance'))['cached_balance__sum'] or 0
     
-    context = {
+    return {
         'total_sales': monthly_sales,
         'today_sales': today_sales,
         'debt_pending': debt_pending,
     }
-    return render(request, 'pos/dashboard.html', context)
+
+# Keyset pagination for the long listings (clients, inventory)
+PAGE_SIZE = 30
+
+def keyset_page(queryset, size=PAGE_SIZE):
+    """Fetch one page plus one extra row to know if there is a next page"""
+    rows = list(queryset[:size + 1])
+    return rows[:size], len(rows) > size
+
+# Largest id the database accepts; a bigger one in a tampered cursor
+# would make the query fail instead of showing the first page
+MAX_CURSOR_ID = 2 ** 63 - 1
+
+def parse_id_cursor(cursor):
+    # Cursor format: id of the last row shown
+    try:
+        obj_id = int(cursor)
+    except (TypeError, ValueError):
+        return None
+    return obj_id if 0 < obj_id <= MAX_CURSOR_ID else None
+
+def make_datetime_cursor(dt, obj_id):
+    return f"{dt.isoformat()}~{obj_id}"
+
+def parse_datetime_cursor(cursor):
+    # Cursor format: "<datetime isoformat>~<id>" of the last row shown
+    try:
+        dt_str, obj_id = cursor.rsplit('~', 1)
+        dt = timezone.datetime.fromisoformat(dt_str)
+    except (AttributeError, ValueError):
+        return None
+    obj_id = parse_id_cursor(obj_id)
+    # Cursors are always made from aware datetimes
+    if obj_id is None or timezone.is_naive(dt):
+        return None
+    return dt, obj_id
+
+def product_partial_etag(request, *args, **kwargs):
+    """
+    HTMX product lists only change with the catalog, so its version is their
+    ETag. They embed the CSRF token, which rotates on login, hence its hash.
+    """
+    if not request.htmx:
+        return None
+    csrf = hashlib.sha256(request.META.get('CSRF_COOKIE', '').encode()).hexdigest()[:12]
+    return f'products-{catalog.current_version()}-{csrf}'
+
+def product_partial(view):
+    """Revalidate HTMX product lists with the catalog ETag instead of rendering them again"""
+    if iscoroutinefunction(view):
+        conditional = async_product_condition(view)
+    else:
+        conditional = condition(etag_func=product_partial_etag)(view)
+    conditional = cache_control(private=True, no_cache=True)(conditional)
+    return vary_on_headers('HX-Request')(conditional)
+
+def async_product_condition(view):
+    # condition() would run the ETag query on the event loop
+    @wraps(view)
+    async def conditional(request, *args, **kwargs):
+        etag = await sync_to_async(product_partial_etag)(request)
+        etag = quote_etag(etag) if etag else None
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+        if etag and request.method in ('GET', 'HEAD'):
+            response.headers.setdefault('ETag', etag)
+        return response
+    return conditional
 
 @login_required
+@product_partial
 def inventory(request):
     products = Product.objects.all().order_by('-id')
+    query = request.GET.get('search', '')
+    if query:
+        products = search.filter_products(products, query)
+
+    cursor = request.GET.get('cursor')
+    last_id = parse_id_cursor(cursor) if cursor else None
+    if last_id:
+        products = products.filter(id__lt=last_id)
+    else:
+        cursor = None
+
+    products, has_more = keyset_page(products)
+    context = {
+        'products': products,
+        'search': query,
+        'cursor': cursor,
+        'next_cursor': str(products[-1].id) if has_more else None,
+    }
     if request.htmx:
-        query = request.GET.get('search')
-        if query:
-            products = products.filter(name__icontains=query)
-        return render(request, 'pos/partials/product_list.html', {'products': products})
-    return render(request, 'pos/inventory.html', {'products': products})
+        return render(request, 'pos/partials/product_list.html', context)
+    return render(request, 'pos/inventory.html', context)
 
 @login_required
 def clients(request):
-    clients_list = Client.objects.all().order_by('-created_at')
+    # Balance comes from the cached column, so a page is a single query
+    clients_list = Client.objects.all().order_by('-created_at', '-id')
+    query = request.GET.get('search', '')
+    if query:
+        clients_list = clients_list.filter(name__icontains=query)
+
+    cursor = request.GET.get('cursor')
+    position = parse_datetime_cursor(cursor) if cursor else None
+    if position:
+        created_at, client_id = position
+        clients_list = clients_list.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=client_id)
+        )
+    else:
+        cursor = None
+
+    clients_list, has_more = keyset_page(clients_list)
+    next_cursor = None
+    if has_more:
+        last = clients_list[-1]
+        next_cursor = make_datetime_cursor(last.created_at, last.id)
+
+    context = {
+        'clients': clients_list,
+        'search': query,
+        'cursor': cursor,
+        'next_cursor': next_cursor,
+    }
     if request.htmx:
-        query = request.GET.get('search')
-        if query:
-            clients_list = clients_list.filter(name__icontains=query)
-        return render(request, 'pos/partials/client_list.html', {'clients': clients_list})
-    return render(request, 'pos/clients.html', {'clients': clients_list})
+        return render(request, 'pos/partials/client_list.html', context)
+    return render(request, 'pos/clients.html', context)
 
-def get_account_timeline(client):
-    sales = Sale.objects.filter(client=client).order_by('date')
-    payments = Payment.objects.filter(client=client).order_by('date')
+def events_after(key):
+    """Filters for the sales/payments that sort after a checkpoint key"""
+    date, event_type, event_id = key
+    if event_type == StatementCheckpoint.SALE:
+        sales_q = Q(date__gt=date) | Q(date=date, id__gt=event_id)
+        payments_q = Q(date__gte=date)
+    else:
+        sales_q = Q(date__gt=date)
+        payments_q = Q(date__gt=date) | Q(date=date, id__gt=event_id)
+    return sales_q, payments_q
 
+def build_timeline(sales, payments):
+    """
+    Merge credit sales (with items prefetched) and payments of one client
+    into a running-balance timeline. Returns (timeline, cutoff_index), where
+    cutoff_index is the last event that left the balance at zero (-1 if none).
+    """
     timeline = []
     
     # Add Credit Sales
     for sale in sales:
-        if sale.payment_method == 'CREDIT':
-            timeline.append({
-                'type': 'SALE',
-                'date': sale.date,
-                'amount': sale.total,
-                'ref': f"Factura #{sale.id}",
-                'items': sale.items.all(),
-                'object': sale
-            })
+        timeline.append({
+            'type': 'SALE',
+            'key': (sale.date, StatementCheckpoint.SALE, sale.id),
+            'date': sale.date,
+            'amount': sale.total,
+            'ref': f"Factura #{sale.id}",
+            'items': sale.items.all(),
+            'object': sale
+        })
         
     # Add Payments
     for payment in payments:
         timeline.append({
             'type': 'PAYMENT',
+            'key': (payment.date, StatementCheckpoint.PAYMENT, payment.id),
             'date': payment.date,
             'amount': payment.amount,
             'ref': payment.note or "Abono",
@@ -95,7 +236,7 @@ def get_account_timeline(client):
         })
         
     # Sort chronologically (Oldest first)
-    timeline.sort(key=lambda x: x['date'])
+    timeline.sort(key=lambda x: x['key'])
     
     running_balance = 0
     cutoff_index = -1
@@ -120,116 +261,219 @@ def get_account_timeline(client):
             
     return calculated_timeline, cutoff_index
 
-@login_required
-def client_statement(request, client_id):
-    client = get_object_or_404(Client, id=client_id)
-    
-    full_timeline, cutoff_index = get_account_timeline(client)
-    
-    # Split timeline into History and Active
+def get_account_timeline(client, after=None, until=None):
+    """
+    Chronological credit sales and payments with a running balance.
+
+    `after` / `until` are checkpoint keys (date, event_type, event_id); the
+    running balance starts at 0 because checkpoints are zero-balance points.
+    """
+    sales = Sale.objects.filter(client=client, payment_method='CREDIT').order_by('date', 'id').prefetch_related('items__product')
+    payments = Payment.objects.filter(client=client).order_by('date', 'id')
+    if after:
+        sales_q, payments_q = events_after(after)
+        sales = sales.filter(sales_q)
+        payments = payments.filter(payments_q)
+    if until:
+        sales_q, payments_q = events_after(until)
+        sales = sales.exclude(sales_q)
+        payments = payments.exclude(payments_q)
+
+    return build_timeline(sales, payments)
+
+def get_active_timeline(client, persist=False):
+    """
+    Events since the client's balance was last zero.
+
+    Only events after the stored checkpoint are loaded. If a newer zero point
+    shows up and `persist` is set, the checkpoint moves forward to it; pages
+    anyone can open (public statement, PDF) only read checkpoints.
+    Returns (timeline, checkpoint).
+    """
+    checkpoint = StatementCheckpoint.objects.filter(client=client).first()
+    timeline, cutoff_index = get_account_timeline(client, after=checkpoint.key if checkpoint else None)
+
     if cutoff_index != -1:
-        history_timeline = full_timeline[:cutoff_index+1]
-        active_timeline = full_timeline[cutoff_index+1:]
-        # Reverse active timeline for display? No, keep chronological usually for statements.
-        
-        # If reset, the running balance of active list continues from 0.
-        # Wait, the calculation in get_account_timeline is continuous.
-        # If balance was 0 at cutoff, the next item starting balance is technically correct (0 +/- amount).
-        # We don't need to recalculate.
-    else:
-        history_timeline = []
-        active_timeline = full_timeline
+        if persist:
+            checkpoint = save_checkpoint(client.id, timeline[cutoff_index]['key']) or checkpoint
+        timeline = timeline[cutoff_index+1:]
+    return timeline, checkpoint
+
+def save_checkpoint(client_id, key):
+    """
+    Store `key` as the client's zero point, or return None if it no longer is.
+
+    The timeline was read without locks, so a sale or payment saved meanwhile
+    (say, a backdated one) may have moved the balance. Under the client's row
+    lock, which StatementCheckpoint.invalidate() also takes, the balance up
+    to `key` is summed again from the current checkpoint.
+    """
+    with transaction.atomic():
+        Client.lock(client_id)
+        current = StatementCheckpoint.objects.filter(client_id=client_id).first()
+        if current and current.key >= key:
+            return current
+        sales = Sale.objects.filter(client_id=client_id, payment_method='CREDIT')
+        payments = Payment.objects.filter(client_id=client_id)
+        if current:
+            sales_q, payments_q = events_after(current.key)
+            sales, payments = sales.filter(sales_q), payments.filter(payments_q)
+        sales_q, payments_q = events_after(key)
+        balance = (
+            (sales.exclude(sales_q).aggregate(s=Sum('total'))['s'] or 0)
+            - (payments.exclude(payments_q).aggregate(s=Sum('amount'))['s'] or 0)
+        )
+        if balance != 0:
+            return None
+        date, event_type, event_id = key
+        checkpoint, _ = StatementCheckpoint.objects.update_or_create(
+            client_id=client_id,
+            defaults={'date': date, 'event_type': event_type, 'event_id': event_id, 'balance': 0},
+        )
+    return checkpoint
 
-    # Summary fields
-    # We show LIFETIME totals or ACTIVE totals? User request: "se reinicie la información".
-    # Assuming "reset" means display purposes. 
+def statement_context(client, persist=False):
+    active_timeline, checkpoint = get_active_timeline(client, persist=persist)
+    return summarize_statement(client, active_timeline, checkpoint)
+
+def summarize_statement(client, active_timeline, checkpoint=None):
     # Current debt is strictly the final balance.
-    
     current_debt = active_timeline[-1]['balance'] if active_timeline else 0
     
-    # Let's calculate totals for the ACTIVE period only, to match the "reset" feel.
+    # Totals for the ACTIVE period only, to match the "reset" feel.
     active_credit = sum(e['amount'] for e in active_timeline if e['type'] == 'SALE')
     active_paid = sum(e['amount'] for e in active_timeline if e['type'] == 'PAYMENT')
 
-    context = {
+    return {
         'client': client,
-        'timeline': active_timeline, 
-        'history_timeline': history_timeline,
+        'timeline': active_timeline,  # Chronological order
         'total_credit': active_credit,
         'total_paid': active_paid,
         'current_debt': current_debt,
+        'checkpoint': checkpoint,
         'now': timezone.now(),
-        'is_public': False
     }
+
+def bulk_statement_contexts(clients, persist=False):
+    """
+    Statement contexts for many clients at once (month-end batch).
+
+    Loads every credit sale (with items), payment and checkpoint of `clients`
+    (a Client queryset) in a fixed number of queries instead of running
+    `statement_context` per client. Yields contexts in `clients` order.
+    With `persist`, checkpoints that moved forward are saved (one
+    transaction per such client).
+    """
+    sales_by_client = {}
+    sales = (
+        Sale.objects.filter(client__in=clients, payment_method='CREDIT')
+        .order_by('client_id', 'date', 'id')
+        .prefetch_related('items__product')
+    )
+    for sale in sales.iterator(chunk_size=2000):
+        sales_by_client.setdefault(sale.client_id, []).append(sale)
+
+    payments_by_client = {}
+    for payment in Payment.objects.filter(client__in=clients).order_by('client_id', 'date', 'id').iterator(chunk_size=2000):
+        payments_by_client.setdefault(payment.client_id, []).append(payment)
+
+    checkpoints = {c.client_id: c for c in StatementCheckpoint.objects.filter(client__in=clients)}
+
+    for client in clients:
+        timeline, cutoff_index = build_timeline(
+            sales_by_client.get(client.id, []), payments_by_client.get(client.id, [])
+        )
+        checkpoint = checkpoints.get(client.id)
+        if persist and cutoff_index != -1:
+            key = timeline[cutoff_index]['key']
+            if checkpoint is None or key > checkpoint.key:
+                checkpoint = save_checkpoint(client.id, key) or checkpoint
+        yield summarize_statement(client, timeline[cutoff_index+1:], checkpoint)
+
+@login_required
+def client_statement(request, client_id):
+    client = get_object_or_404(Client, id=client_id)
+    
+    context = statement_context(client, persist=True)
+
+    # Settled history (before the checkpoint) is loaded on demand,
+    # here we only count it
+    checkpoint = context['checkpoint']
+    history_count = 0
+    if checkpoint:
+        sales_q, payments_q = events_after(checkpoint.key)
+        history_count = (
+            Sale.objects.filter(client=client, payment_method='CREDIT').exclude(sales_q).count()
+            + Payment.objects.filter(client=client).exclude(payments_q).count()
+        )
+
+    context.update({
+        'history_count': history_count,
+        'is_public': False
+    })
     return render(request, 'pos/client_statement.html', context)
 
+@login_required
+def client_statement_history(request, client_id):
+    client = get_object_or_404(Client, id=client_id)
+    checkpoint = StatementCheckpoint.objects.filter(client=client).first()
+    history_timeline = []
+    if checkpoint:
+        history_timeline, _ = get_account_timeline(client, until=checkpoint.key)
+    return render(request, 'pos/partials/statement_history.html', {'history_timeline': history_timeline})
+
 def client_public_statement(request, client_id):
     client = get_object_or_404(Client, id=client_id)
     
-    full_timeline, cutoff_index = get_account_timeline(client)
-    
-    if cutoff_index != -1:
-        active_timeline = full_timeline[cutoff_index+1:]
-    else:
-        active_timeline = full_timeline
-        
-    current_debt = active_timeline[-1]['balance'] if active_timeline else 0
-    active_credit = sum(e['amount'] for e in active_timeline if e['type'] == 'SALE')
-    active_paid = sum(e['amount'] for e in active_timeline if e['type'] == 'PAYMENT')
-
-    context = {
-        'client': client,
-        'timeline': active_timeline,
-        # No history passed
-        'total_credit': active_credit,
-        'total_paid': active_paid,
-        'current_debt': current_debt,
-        'now': timezone.now(),
-        'is_public': True
-    }
+    context = statement_context(client)
+    context['is_public'] = True
     return render(request, 'pos/client_statement.html', context)
 
 @login_required
 def add_payment(request, client_id):
     if request.method == 'POST':
         client = get_object_or_404(Client, id=client_id)
-        amount = request.POST.get('amount')
         note = request.POST.get('note')
+        try:
+            amount = int(request.POST.get('amount'))
+        except (TypeError, ValueError):
+            messages.error(request, 'Monto inválido')
+            return redirect('client_statement', client_id=client_id)
         
-        Payment.objects.create(
-            client=client,
-            amount=amount,
-            note=note
-        )
+        with transaction.atomic():
+            payment = Payment.objects.create(
+                client=client,
+                amount=amount,
+                note=note
+            )
+            Client.adjust_balance(client.id, -amount)
+            StatementCheckpoint.invalidate(client.id, payment.date)
         messages.success(request, 'Pago registrado')
     return redirect('client_statement', client_id=client_id)
 
 @login_required
 def pos(request):
-    clients = Client.objects.all()
-    cart_items, cart_total = get_cart_data(request.session)
+    # Clients are picked through the search_clients typeahead, not listed here
+    cart_items, cart_total = cart.cart_items(request.session)
     return render(request, 'pos/pos.html', {
-        'clients': clients, 
         'cart_items': cart_items, 
         'cart_total': cart_total
     })
 
 @login_required
-def search_products(request):
+@product_partial
+async def search_products(request):
     query = request.GET.get('search')
-    if query:
-        products = Product.objects.filter(name__icontains=query)
-    else:
-        products = []
+    products = await search.asearch_products(query, limit=20)
     return render(request, 'pos/partials/pos_product_search.html', {'products': products})
 
 @login_required
 def add_to_cart(request):
-    cart = request.session.get('cart', {})
     product_id = request.POST.get('product_id')
     
-    if not product_id:
+    if not product_id or not product_id.isdigit():
         return HttpResponse(status=400)
+    product_id = int(product_id)
     
     # Get custom quantity (default 1)
     try:
@@ -237,67 +481,111 @@ def add_to_cart(request):
     except ValueError:
         quantity_add = 1
 
-    product = get_object_or_404(Product, id=product_id)
-    product_id_str = str(product_id) # JSON keys are strings
+    if product_id not in product_cache.get_products([product_id]):
+        raise Http404
+    cart.add(request.session, product_id, quantity_add)
     
-    if product_id_str in cart:
-        cart[product_id_str]['quantity'] += quantity_add
-    else:
-        cart[product_id_str] = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'quantity': quantity_add,
-        }
+    cart_items, cart_total = cart.cart_items(request.session)
+    return render(request, 'pos/partials/cart_items.html', {'cart_items': cart_items, 'cart_total': cart_total})
+
+@login_required
+def scan_barcode(request):
+    """Scanner fast path: barcode straight to the cart"""
+    if request.method != 'POST':
+        return HttpResponse(status=405)
     
-    request.session['cart'] = cart
+    code = (request.POST.get('barcode') or request.POST.get('search') or '').strip()
+    try:
+        quantity_add = int(request.POST.get('quantity', 1))
+    except ValueError:
+        quantity_add = 1
+    
+    product = product_cache.lookup_barcode(code)
+    if product is None:
+        # Not a barcode: show regular search results instead
+        products = search.search_products(code, limit=20)
+        response = render(request, 'pos/partials/pos_product_search.html', {'products': products})
+        return retarget(response, '#pos-results')
     
-    cart_items, cart_total = get_cart_data(request.session)
+    cart.add(request.session, product.id, quantity_add)
+    
+    cart_items, cart_total = cart.cart_items(request.session)
     return render(request, 'pos/partials/cart_items.html', {'cart_items': cart_items, 'cart_total': cart_total})
 
 @login_required
 def update_cart_item(request):
-    cart = request.session.get('cart', {})
     product_id = request.POST.get('product_id')
     action = request.POST.get('action') # 'increment', 'decrement', 'remove'
     
-    product_id_str = str(product_id)
-    
-    if product_id_str and product_id_str in cart:
+    if product_id and product_id.isdigit():
         if action == 'increment':
-            cart[product_id_str]['quantity'] += 1
+            cart.add(request.session, int(product_id), 1)
         elif action == 'decrement':
-            cart[product_id_str]['quantity'] -= 1
-            if cart[product_id_str]['quantity'] < 1:
-                del cart[product_id_str]
+            cart.add(request.session, int(product_id), -1)
         elif action == 'remove':
-            del cart[product_id_str]
+            cart.remove(request.session, int(product_id))
             
-    request.session['cart'] = cart
-    cart_items, cart_total = get_cart_data(request.session)
+    cart_items, cart_total = cart.cart_items(request.session)
     return render(request, 'pos/partials/cart_items.html', {'cart_items': cart_items, 'cart_total': cart_total})
 
 @login_required
 def clear_cart(request):
-    request.session['cart'] = {}
+    cart.clear(request.session)
     return render(request, 'pos/partials/cart_items.html', {'cart_items': [], 'cart_total': 0})
 
+def record_sale(client, payment_method, quantities, prices, sale_date, note, uuid=None):
+    """
+    Write a sale with its items, stock, rollups and client balance.
+
+    `quantities` / `prices` are {product_id: value}. Fixed number of queries
+    whatever the number of lines: sale INSERT, one bulk INSERT of items, the
+    stock movements and their UPDATE.
+    """
+    total = sum(prices[pid] * qty for pid, qty in quantities.items())
+    with transaction.atomic():
+        sale = Sale.objects.create(
+            client=client,
+            payment_method=payment_method,
+            total=total,
+            is_paid=(payment_method == 'CASH'),
+            date=sale_date,
+            note=note,
+            uuid=uuid,
+        )
+        
+        SaleItem.objects.bulk_create([
+            SaleItem(
+                sale=sale,
+                product_id=pid,
+                quantity=qty,
+                price=prices[pid]
+            )
+            for pid, qty in quantities.items()
+        ])
+        
+        stock.move({pid: -qty for pid, qty in quantities.items()}, StockMovement.SALE, sale=sale)
+        
+        rollups.add_sale(sale_date, payment_method, total)
+        rollups.add_products(sale_date, quantities)
+        
+        if payment_method == 'CREDIT':
+            Client.adjust_balance(client.id, total)
+            StatementCheckpoint.invalidate(client.id, sale_date)
+    return sale
+
 @login_required
 def checkout(request):
     if request.method == 'POST':
         client_id = request.POST.get('client_id')
         payment_method = request.POST.get('payment_method')
-        cart = request.session.get('cart', {})
+        quantities = cart.get_cart(request.session)
         
-        if not cart or not client_id:
+        if not quantities or not client_id:
             messages.error(request, 'Carrito vacío o cliente no seleccionado')
             return redirect('pos')
             
         client = get_object_or_404(Client, id=client_id)
         
-        # Recalculate total just to be safe
-        total = sum(item['price'] * item['quantity'] for item in cart.values())
-        
         # Custom Date Handling
         created_at_str = request.POST.get('created_at')
         sale_date = timezone.now()
@@ -314,33 +602,181 @@ def checkout(request):
             except (ValueError, TypeError):
                 pass
         
-        sale = Sale.objects.create(
-            client=client,
-            payment_method=payment_method,
-            total=total,
-            is_paid=(payment_method == 'CASH'),
-            date=sale_date,
-            note=note
-        )
+        # One query for every product in the cart, before writing anything.
+        # Prices come from the database, the session only holds quantities.
+        prices = dict(Product.objects.filter(id__in=quantities).values_list('id', 'price'))
+        if len(prices) != len(quantities):
+            messages.error(request, 'Algunos productos del carrito ya no existen')
+            return redirect('pos')
         
-        for item in cart.values():
-            product = get_object_or_404(Product, id=item['id'])
-            SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                quantity=item['quantity'],
-                price=item['price']
-            )
-            # Update stock
-            product.stock -= item['quantity']
-            product.save()
-            
-        request.session['cart'] = {}
+        sale = record_sale(client, payment_method, quantities, prices, sale_date, note)
+        
+        cart.clear(request.session)
         messages.success(request, f'Venta #{sale.id} registrada correctamente')
         return redirect('pos')
         
     return redirect('pos')
 
+def catalog_etag(request):
+    return f'catalog-{catalog.current_version()}-{request.GET.get("since", "")}'
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_etag)
+def pos_catalog(request):
+    """
+    Product catalog for terminals: the full snapshot, or with ?since=<version>
+    only what changed after it. Unchanged versions answer 304.
+    """
+    try:
+        since = int(request.GET.get('since', ''))
+    except ValueError:
+        since = None
+    # A version from the future means the database was replaced: start over
+    if since is None or since > catalog.current_version():
+        return JsonResponse(catalog.snapshot())
+    return JsonResponse(catalog.changes_since(since))
+
+def client_feed_etag(request):
+    return f'clients-{catalog.current_client_version()}-{request.GET.get("since", "")}'
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=client_feed_etag)
+def pos_clients(request):
+    """
+    Client list the register uses to pick a client while offline: like
+    pos_catalog, the full list or with ?since=<version> only the changes.
+    """
+    try:
+        since = int(request.GET.get('since', ''))
+    except ValueError:
+        since = None
+    if since is None or since > catalog.current_client_version():
+        return JsonResponse(catalog.client_snapshot())
+    return JsonResponse(catalog.client_changes_since(since))
+
+SYNC_MAX_SALES = 500
+
+def parse_offline_sale(entry):
+    """Validate one queued sale. Returns (uuid, data) or raises ValueError with the reason."""
+    try:
+        sale_uuid = UUID(str(entry['uuid']))
+    except (KeyError, ValueError, TypeError):
+        raise ValueError('uuid inválido')
+    if entry.get('payment_method') not in dict(Sale.PAYMENT_METHODS):
+        raise ValueError('Forma de pago inválida')
+    try:
+        client_id = int(entry['client_id'])
+        quantities = {}
+        for item in entry['items']:
+            product_id, quantity = int(item['product_id']), int(item['quantity'])
+            if quantity < 1:
+                raise ValueError
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    except (KeyError, ValueError, TypeError):
+        raise ValueError('Cliente o productos inválidos')
+    if not quantities:
+        raise ValueError('Venta sin productos')
+
+    sale_date = timezone.now()
+    if entry.get('date'):
+        try:
+            # parse_datetime raises TypeError for a non-string, ValueError
+            # for an impossible date, and returns None for another format
+            sale_date = parse_datetime(entry['date'])
+        except (ValueError, TypeError):
+            sale_date = None
+        if sale_date is None:
+            raise ValueError('Fecha inválida')
+    if timezone.is_naive(sale_date):
+        sale_date = timezone.make_aware(sale_date)
+
+    return sale_uuid, {
+        'client_id': client_id,
+        'payment_method': entry['payment_method'],
+        'quantities': quantities,
+        'sale_date': sale_date,
+        'note': entry.get('note') or '',
+    }
+
+@login_required
+def sync_sales(request):
+    """
+    Bulk ingest of sales made while the register was offline.
+
+    Body: {"sales": [{"uuid", "client_id", "payment_method", "date", "note",
+    "items": [{"product_id", "quantity"}]}]}. Sales are keyed by the uuid the
+    register generated, so re-sending a batch (e.g. after a lost response)
+    never duplicates anything. Valid sales are written in one transaction,
+    priced like the online checkout; invalid ones are reported and skipped.
+
+    Answers {"results": [...]} with one entry per sent sale, in the same
+    order (an entry without a valid uuid still gets its own):
+    {"uuid", "status": "created" | "duplicate" | "rejected", "sale_id" | "error"}.
+    """
+    if request.method != 'POST':
+        return HttpResponse(status=405)
+    try:
+        entries = json.loads(request.body)['sales']
+        if not isinstance(entries, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    if len(entries) > SYNC_MAX_SALES:
+        return JsonResponse({'error': f'Máximo {SYNC_MAX_SALES} ventas por envío'}, status=400)
+
+    results = [None] * len(entries)
+    parsed = {}  # uuid -> (index, data)
+    repeated = []  # (index, index of the first entry with the same uuid)
+    for index, entry in enumerate(entries):
+        try:
+            sale_uuid, data = parse_offline_sale(entry)
+        except ValueError as e:
+            results[index] = {'status': 'rejected', 'error': str(e)}
+            continue
+        if sale_uuid in parsed:
+            repeated.append((index, parsed[sale_uuid][0]))
+            continue
+        parsed[sale_uuid] = (index, data)
+
+    # Three queries for the whole batch: already synced, clients, prices
+    existing = dict(Sale.objects.filter(uuid__in=parsed).values_list('uuid', 'id'))
+    client_ids = {data['client_id'] for _, data in parsed.values()}
+    clients_by_id = Client.objects.in_bulk(client_ids)
+    product_ids = {pid for _, data in parsed.values() for pid in data['quantities']}
+    prices = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'price'))
+
+    with transaction.atomic():
+        for sale_uuid, (index, data) in parsed.items():
+            if sale_uuid in existing:
+                results[index] = {'status': 'duplicate', 'sale_id': existing[sale_uuid]}
+                continue
+            client = clients_by_id.get(data['client_id'])
+            if client is None or any(pid not in prices for pid in data['quantities']):
+                results[index] = {'status': 'rejected', 'error': 'Cliente o productos inexistentes'}
+                continue
+            try:
+                sale = record_sale(
+                    client, data['payment_method'], data['quantities'], prices,
+                    data['sale_date'], data['note'], uuid=sale_uuid,
+                )
+            except IntegrityError:
+                # Same uuid committed by a concurrent sync
+                results[index] = {'status': 'duplicate'}
+                continue
+            results[index] = {'status': 'created', 'sale_id': sale.id}
+
+    # A uuid sent twice in the batch is written once; the repeat is its duplicate
+    for index, first in repeated:
+        results[index] = dict(results[first])
+        if results[index]['status'] == 'created':
+            results[index]['status'] = 'duplicate'
+
+    for entry, result in zip(entries, results):
+        result['uuid'] = str(entry['uuid']) if isinstance(entry, dict) and 'uuid' in entry else None
+    return JsonResponse({'results': results})
+
 @login_required
 def add_product(request):
     if request.method == 'POST':
@@ -355,9 +791,39 @@ def add_product(request):
             price=price,
             stock=stock
         )
+        product_cache.invalidate(barcode)
         messages.success(request, 'Producto agregado correctamente.')
     return redirect('inventory')
 
+@login_required
+def import_products(request):
+    """Bulk create/update products from an uploaded supplier CSV (see product_import)"""
+    upload = request.FILES.get('file')
+    if request.method != 'POST' or not upload:
+        messages.error(request, 'Seleccione un archivo CSV')
+        return redirect('inventory')
+    encoding = 'latin-1' if request.POST.get('encoding') == 'latin-1' else 'utf-8-sig'
+    text = io.TextIOWrapper(upload.file, encoding=encoding, newline='')
+    try:
+        result = product_import.import_products(text)
+    except product_import.ImportFileError as exc:
+        messages.error(request, str(exc))
+        return redirect('inventory')
+    except UnicodeDecodeError:
+        # Chunks before the bad byte are already saved
+        messages.error(request, 'No se pudo leer el archivo: use UTF-8 o elija Latin-1')
+        return redirect('inventory')
+    messages.success(
+        request,
+        f"Importación: {result['created']} productos nuevos, {result['updated']} actualizados "
+        f"de {result['rows']} filas.",
+    )
+    if result['error_count']:
+        shown = '; '.join(f'línea {line}: {message}' for line, message in result['errors'][:5])
+        more = result['error_count'] - min(5, len(result['errors']))
+        messages.warning(request, f"{result['error_count']} filas con error ({shown}{f'; y {more} más' if more else ''}).")
+    return redirect('inventory')
+
 @login_required
 def add_client(request):
     if request.method == 'POST':
@@ -371,52 +837,51 @@ def add_client(request):
         except ValueError:
             initial_debt = 0
             
-        client = Client.objects.create(
-            name=name,
-            phone=phone,
-            email=email,
-            address=address
-        )
-        
-        # Handle Initial Debt / Historical Balance
-        if initial_debt > 0:
-            # Get or Create system product for opening balances
-            # Use price=0 as base, we will override in SaleItem
-            debt_product, _ = Product.objects.get_or_create(
-                name="SALDO ANTERIOR",
-                defaults={'price': 0, 'stock': 0, 'barcode': 'SYS-DEBT'}
-            )
-            
-            # Create the Debt Sale
-            sale = Sale.objects.create(
-                client=client,
-                payment_method='CREDIT',
-                total=initial_debt,
-                is_paid=False,
-                date=timezone.now() # Or ideally allow date selection, but NOW is fine for "Opening"
+        # The client, its opening-debt sale and its balance are written together
+        with transaction.atomic():
+            client = Client.objects.create(
+                name=name,
+                phone=phone,
+                email=email,
+                address=address
             )
-            
-            SaleItem.objects.create(
-                sale=sale,
-                product=debt_product,
-                quantity=1,
-                price=initial_debt
-            )
-            
+
+            # Handle Initial Debt / Historical Balance
+            if initial_debt > 0:
+                # Get or Create system product for opening balances
+                # Use price=0 as base, we will override in SaleItem
+                debt_product, _ = Product.objects.get_or_create(
+                    name="SALDO ANTERIOR",
+                    defaults={'price': 0, 'stock': 0, 'barcode': 'SYS-DEBT'}
+                )
+
+                # Create the Debt Sale
+                sale = Sale.objects.create(
+                    client=client,
+                    payment_method='CREDIT',
+                    total=initial_debt,
+                    is_paid=False,
+                    date=timezone.now() # Or ideally allow date selection, but NOW is fine for "Opening"
+                )
+
+                SaleItem.objects.create(
+                    sale=sale,
+                    product=debt_product,
+                    quantity=1,
+                    price=initial_debt
+                )
+                Client.adjust_balance(client.id, initial_debt)
+                rollups.add_sale(sale.date, 'CREDIT', initial_debt)
+                rollups.add_products(sale.date, {debt_product.id: 1})
+
         messages.success(request, 'Cliente agregado correctamente.')
     return redirect('clients')
 
 @login_required
-def search_clients(request):
+async def search_clients(request):
     # HTMX sends the input name as the key. We handled 'search' but 'client_search_display' is coming from POS.
     query = request.GET.get('search') or request.GET.get('client_search_display') or ''
-    
-    if query:
-        clients = Client.objects.filter(
-            Q(name__icontains=query) | Q(phone__icontains=query)
-        )[:10] # Limit results
-    else:
-        clients = []
+    clients = await search.asearch_clients(query, limit=10)
     return render(request, 'pos/partials/client_search_dropdown.html', {'clients': clients})
 
 # Public Views
@@ -425,16 +890,12 @@ def public_search(request):
 
 def public_check_debt(request):
     if request.method == 'POST':
-        phone = request.POST.get('phone')
-        # Removing non-numeric chars could be good practice
-        client = Client.objects.filter(phone=phone).first()
+        phone = Client.normalize_phone(request.POST.get('phone'))
+        client = Client.objects.filter(phone_digits=phone).first() if phone else None
         
         if client:
              # Reuse logic or template? Let's use a simplified partial
-             # Calculate balance
-             credit_sales = client.sale_set.filter(payment_method='CREDIT').aggregate(Sum('total'))['total__sum'] or 0
-             payments = client.payments.aggregate(Sum('amount'))['amount__sum'] or 0
-             balance = credit_sales - payments
+             balance = client.balance
              
              last_sales = client.sale_set.order_by('-date')[:5]
              
@@ -446,13 +907,23 @@ def public_check_debt(request):
              return render(request, 'pos/partials/public_result.html', context)
         else:
             return HttpResponse('<div class="bg-red-100 text-red-700 p-4 rounded-xl text-center">No encontramos un cliente con ese número.</div>')
-@login_required
-def report_analytics(request):
-    # Date Filtering
+def local_day_range(date_start, date_end):
+    """
+    [start, end) aware datetimes covering the local days date_start..date_end.
+
+    Filtering with these instead of `date__date` lets the database compare the
+    raw column (and use its index) instead of converting every row's timezone.
+    """
+    start = timezone.make_aware(timezone.datetime.combine(date_start, timezone.datetime.min.time()))
+    end = timezone.make_aware(timezone.datetime.combine(date_end + timezone.timedelta(days=1), timezone.datetime.min.time()))
+    return start, end
+
+def report_dates(request):
+    """date_start/date_end from the query string, last 30 days by default"""
     date_start_str = request.GET.get('date_start')
     date_end_str = request.GET.get('date_end')
     
-    today = timezone.now().date()
+    today = timezone.localdate()
     
     if date_start_str:
         date_start = timezone.datetime.strptime(date_start_str, '%Y-%m-%d').date()
@@ -463,14 +934,21 @@ def report_analytics(request):
         date_end = timezone.datetime.strptime(date_end_str, '%Y-%m-%d').date()
     else:
         date_end = today
+    return date_start, date_end
 
-    # Filter Querysets
-    # Use __date__range for inclusive filtering on DateTimeField
-    sales_qs = Sale.objects.filter(date__date__gte=date_start, date__date__lte=date_end).order_by('-date')
+def report_sales(date_start, date_end):
+    # Half-open range of aware datetimes so the date index can be used
+    range_start, range_end = local_day_range(date_start, date_end)
+    return Sale.objects.filter(date__gte=range_start, date__lt=range_end).order_by('-date', '-id')
+
+def report_charts(date_start, date_end):
+    """Chart data and KPIs of the reports page, from the daily rollups"""
+    days_qs = DailySalesSummary.objects.filter(date__gte=date_start, date__lte=date_end)
 
     # 1. Sales by Product (Quantity)
-    # Filter items by the filtered sales
-    product_sales = SaleItem.objects.filter(sale__in=sales_qs).values('product__name').annotate(
+    product_sales = DailyProductSummary.objects.filter(
+        date__gte=date_start, date__lte=date_end
+    ).values('product__name').annotate(
         total_qty=Sum('quantity')
     ).order_by('-total_qty')[:10] 
     
@@ -478,77 +956,230 @@ def report_analytics(request):
     data_products = [item['total_qty'] for item in product_sales]
     
     # 2. Daily Sales Trend
-    daily_sales = sales_qs.values('date__date').annotate(
-        daily_total=Sum('total')
-    ).order_by('date__date')
+    daily_sales = list(days_qs.filter(sale_count__gt=0).order_by('date'))
     
-    labels_dates = [item['date__date'].strftime('%d/%m') for item in daily_sales]
-    data_sales = [int(item['daily_total']) for item in daily_sales]
+    labels_dates = [day.date.strftime('%d/%m') for day in daily_sales]
+    data_sales = [day.total for day in daily_sales]
     
     # 3. KPI Metrics
-    total_period = sales_qs.aggregate(Sum('total'))['total__sum'] or 0
-    count_period = sales_qs.count()
+    total_period = sum(day.total for day in daily_sales)
+    count_period = sum(day.sale_count for day in daily_sales)
     # Handle Division by zero
     avg_ticket = total_period / count_period if count_period > 0 else 0
     
-    cash_total = sales_qs.filter(payment_method='CASH').aggregate(Sum('total'))['total__sum'] or 0
-    credit_total = sales_qs.filter(payment_method='CREDIT').aggregate(Sum('total'))['total__sum'] or 0
+    cash_total = sum(day.cash_total for day in daily_sales)
+    credit_total = sum(day.credit_total for day in daily_sales)
 
-    context = {
+    return {
         'labels_products': labels_products,
         'data_products': data_products,
         'labels_dates': labels_dates,
         'data_sales': data_sales,
-        'invoices': sales_qs, # Pass the detailed list
-        'date_start': date_start.strftime('%Y-%m-%d'),
-        'date_end': date_end.strftime('%Y-%m-%d'),
+        'count_period': count_period,
         'total_period': total_period,
         'avg_ticket': avg_ticket,
         'cash_total': cash_total,
         'credit_total': credit_total
     }
+
+@login_required
+def report_analytics(request):
+    # Date Filtering
+    date_start, date_end = report_dates(request)
+
+    # Filter Querysets
+    sales_qs = report_sales(date_start, date_end)
+
+    # Invoice list, one page at a time (infinite scroll like clients/inventory)
+    cursor = request.GET.get('cursor')
+    position = parse_datetime_cursor(cursor) if cursor else None
+    if position:
+        last_date, last_id = position
+        sales_qs = sales_qs.filter(Q(date__lt=last_date) | Q(date=last_date, id__lt=last_id))
+    else:
+        cursor = None
+
+    invoices, has_more = keyset_page(sales_qs.select_related('client'))
+    next_cursor = make_datetime_cursor(invoices[-1].date, invoices[-1].id) if has_more else None
+    page_context = {
+        'invoices': invoices,
+        'cursor': cursor,
+        'next_cursor': next_cursor,
+        'date_start': date_start.strftime('%Y-%m-%d'),
+        'date_end': date_end.strftime('%Y-%m-%d'),
+    }
+    if request.htmx and cursor:
+        return render(request, 'pos/partials/report_invoices.html', page_context)
+
+    context = {
+        **page_context,
+        **stats_cache.cached(
+            'report', [stats_cache.SALES], [date_start, date_end],
+            lambda: report_charts(date_start, date_end),
+        ),
+    }
     return render(request, 'pos/reports.html', context)
 
+# CSV exports, streamed row by row so memory stays flat for any date range
+EXPORT_CHUNK_SIZE = 2000
+
+class Echo:
+    """File-like object for csv.writer that hands back each row instead of storing it"""
+    def write(self, value):
+        return value
+
+async def aiter_chunks(iterator, size=EXPORT_CHUNK_SIZE):
+    """
+    Async iterator over a sync one, `size` items per chunk. Under ASGI Django
+    buffers a sync streaming response whole (sync_to_async(list)); this keeps
+    it streamed. Each chunk is read in the request's thread-sensitive thread,
+    the one holding the database connection of the open query.
+    """
+    next_chunk = sync_to_async(lambda: ''.join(itertools.islice(iterator, size)))
+    while chunk := await next_chunk():
+        yield chunk
+
+def stream_csv(request, filename, header, rows):
+    writer = csv.writer(Echo())
+    def generate():
+        yield '\ufeff' # BOM so Excel reads accents correctly
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+    content = generate()
+    if isinstance(request, ASGIRequest):
+        content = aiter_chunks(content)
+    response = StreamingHttpResponse(content, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def format_local(dt):
+    return timezone.localtime(dt).strftime('%Y-%m-%d %H:%M')
+
+@login_required
+def export_sales_csv(request):
+    date_start, date_end = report_dates(request)
+    sales = report_sales(date_start, date_end).values_list(
+        'id', 'date', 'client__name', 'payment_method', 'total', 'note'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    rows = (
+        (sale_id, format_local(date), client_name, method, total, note or '')
+        for sale_id, date, client_name, method, total, note in sales
+    )
+    return stream_csv(
+        request,
+        f'ventas_{date_start}_{date_end}.csv',
+        ['Factura', 'Fecha', 'Cliente', 'Método', 'Total', 'Nota'],
+        rows,
+    )
+
+@login_required
+def export_sale_items_csv(request):
+    date_start, date_end = report_dates(request)
+    range_start, range_end = local_day_range(date_start, date_end)
+    items = SaleItem.objects.filter(
+        sale__date__gte=range_start, sale__date__lt=range_end
+    ).order_by('-sale__date', '-sale_id', 'id').values_list(
+        'sale_id', 'sale__date', 'sale__client__name', 'product__name', 'product__barcode', 'quantity', 'price'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    rows = (
+        (sale_id, format_local(date), client_name, product_name, barcode or '', quantity, price, quantity * price)
+        for sale_id, date, client_name, product_name, barcode, quantity, price in items
+    )
+    return stream_csv(
+        request,
+        f'detalle_ventas_{date_start}_{date_end}.csv',
+        ['Factura', 'Fecha', 'Cliente', 'Producto', 'Código', 'Cantidad', 'Precio', 'Subtotal'],
+        rows,
+    )
+
+@login_required
+def export_client_statement_csv(request, client_id):
+    """Full account history, merging the two date-ordered streams"""
+    client = get_object_or_404(Client, id=client_id)
+    sales = Sale.objects.filter(client=client, payment_method='CREDIT').order_by('date', 'id').values_list(
+        'date', 'id', 'total', 'note'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    payments = Payment.objects.filter(client=client).order_by('date', 'id').values_list(
+        'date', 'id', 'amount', 'note'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    events = heapq.merge(
+        ((date, StatementCheckpoint.SALE, sale_id, total, note) for date, sale_id, total, note in sales),
+        ((date, StatementCheckpoint.PAYMENT, payment_id, amount, note) for date, payment_id, amount, note in payments),
+    )
+
+    def rows():
+        balance = 0
+        for date, event_type, event_id, amount, note in events:
+            if event_type == StatementCheckpoint.SALE:
+                balance += amount
+                yield (format_local(date), f"Factura #{event_id}", amount, 0, balance, note or '')
+            else:
+                balance -= amount
+                yield (format_local(date), note or "Abono", 0, amount, balance, '')
+
+    return stream_csv(
+        request,
+        f'estado_cuenta_{client.id}.csv',
+        ['Fecha', 'Movimiento', 'Cargo', 'Abono', 'Saldo', 'Nota'],
+        rows(),
+    )
+
 @login_required
 def invoice_detail(request, sale_id):
-    sale = get_object_or_404(Sale, id=sale_id)
+    sale = get_object_or_404(Sale.objects.select_related('client').prefetch_related('items__product'), id=sale_id)
     return render(request, 'pos/invoice_detail.html', {'sale': sale, 'now': timezone.now()})
 
 def client_statement_pdf(request, client_id):
     client = get_object_or_404(Client, id=client_id)
     
-    full_timeline, cutoff_index = get_account_timeline(client)
+    context = statement_context(client)
+    cache_key = pdf.statement_cache_key(context)
+    path = pdf.statement_pdf_path(client.id, cache_key)
     
-    if cutoff_index != -1:
-        active_timeline = full_timeline[cutoff_index+1:]
-    else:
-        active_timeline = full_timeline
-        
-    current_debt = active_timeline[-1]['balance'] if active_timeline else 0
-    active_credit = sum(e['amount'] for e in active_timeline if e['type'] == 'SALE')
-    active_paid = sum(e['amount'] for e in active_timeline if e['type'] == 'PAYMENT')
-
-    context = {
-        'client': client,
-        'timeline': active_timeline,  # Chronological order
-        'total_credit': active_credit,
-        'total_paid': active_paid,
-        'current_debt': current_debt,
-        'now': timezone.now(),
-    }
-    
-    template_path = 'pos/pdf/client_statement_pdf.html'
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Estado_Cuenta_{client.name}.pdf"'
-    
-    template = get_template(template_path)
-    html = template.render(context)
+    # Already rendered for this exact statement: serve from disk
+    if path.exists():
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True,
+            filename=f'Estado_Cuenta_{client.name}.pdf', content_type='application/pdf',
+        )
     
-    pisa_status = pisa.CreatePDF(html, dest=response)
+    # Otherwise queue it for `manage.py pdf_worker` and poll until it's ready.
+    # The page polls every 2 seconds: only render the HTML when queueing it.
+    job = PdfRenderJob.objects.filter(cache_key=cache_key).first()
+    if job is None:
+        html = get_template('pos/pdf/client_statement_pdf.html').render(context)
+        job, created = PdfRenderJob.objects.get_or_create(
+            cache_key=cache_key, defaults={'client': client, 'html': html}
+        )
+    elif job.status == PdfRenderJob.DONE:
+        # File was cleaned up after rendering; render it again
+        html = get_template('pos/pdf/client_statement_pdf.html').render(context)
+        PdfRenderJob.objects.filter(pk=job.pk).update(
+            status=PdfRenderJob.PENDING, html=html, attempts=0, updated_at=timezone.now(),
+        )
+    elif job.status == PdfRenderJob.FAILED and job.attempts < PdfRenderJob.MAX_ATTEMPTS:
+        PdfRenderJob.objects.filter(pk=job.pk).update(status=PdfRenderJob.PENDING, updated_at=timezone.now())
     
-    if pisa_status.err:
-        return HttpResponse('We had some errors <pre>' + html + '</pre>')
-    return response
+    failed = job.status == PdfRenderJob.FAILED and job.attempts >= PdfRenderJob.MAX_ATTEMPTS
+    return render(request, 'pos/pdf_pending.html', {
+        'client': client,
+        'failed': failed,
+        'error': job.error,
+    })
+
+def metrics(request):
+    """Request metrics in Prometheus format, for staff or a bearer token"""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    allowed = (
+        (request.user.is_authenticated and request.user.is_staff)
+        or (token and hmac.compare_digest(authorization, f'Bearer {token}'))
+    )
+    if not allowed:
+        return HttpResponse(status=403)
+    text = request_metrics.prometheus_text() + '\n'.join(stats_cache.prometheus_lines()) + '\n'
+    return HttpResponse(text, content_type='text/plain; version=0.0.4')
 
 def service_worker(request):
     from django.conf import settings
@@ -581,15 +1212,22 @@ def manifest(request):
 def edit_product(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     if request.method == 'POST':
+        previous_barcode = product.barcode
+        previous_name = product.name
         product.name = request.POST.get('name')
         product.barcode = request.POST.get('barcode')
         product.price = request.POST.get('price')
         
-        stock_val = request.POST.get('stock')
-        if stock_val:
-             product.stock = stock_val
-             
-        product.save()
+        with transaction.atomic():
+            # Stock is only changed through the journal
+            product.save(update_fields=['name', 'barcode', 'price'])
+            stock_val = request.POST.get('stock')
+            if stock_val:
+                stock.set_stock(product.id, int(stock_val))
+        product_cache.invalidate(previous_barcode, product.barcode, product_id=product.id)
+        if product.name != previous_name:
+            # Report charts show product names
+            stats_cache.invalidate(stats_cache.SALES)
         messages.success(request, 'Producto actualizado correctamente.')
         return redirect('inventory')
         
@@ -602,8 +1240,7 @@ def add_stock(request, product_id):
         try:
             quantity = int(request.POST.get('quantity'))
             if quantity > 0:
-                product.stock += quantity
-                product.save()
+                stock.move({product.id: quantity}, StockMovement.RESTOCK)
                 messages.success(request, f'Se agregaron {quantity} unidades a {product.name}')
             else:
                  messages.error(request, 'La cantidad debe ser mayor a 0')
@@ -620,14 +1257,15 @@ def edit_client(request, client_id):
         client.phone = request.POST.get('phone')
         client.email = request.POST.get('email')
         client.address = request.POST.get('address')
-        client.save()
+        # cached_balance is only changed with F() deltas; don't write back the value read above
+        client.save(update_fields=['name', 'phone', 'email', 'address'])
         messages.success(request, 'Cliente actualizado correctamente.')
         return redirect('clients')
     return render(request, 'pos/edit_client.html', {'client': client})
 
 @login_required
 def edit_sale(request, sale_id):
-    sale = get_object_or_404(Sale, id=sale_id)
+    sale = get_object_or_404(Sale.objects.select_related('client'), id=sale_id)
     if request.method == 'POST':
         # Edit Client
         client_id = request.POST.get('client_id')
@@ -646,25 +1284,51 @@ def edit_sale(request, sale_id):
                  messages.error(request, 'Formato de fecha inválido')
         
         sale.note = request.POST.get('note', '')
-        sale.save()
+        with transaction.atomic():
+            # The total is only changed with F() deltas by the item edits:
+            # don't write back the value read above, re-read it (and what is
+            # being moved) under the sale's lock
+            Sale.lock(sale.pk)
+            previous_client_id, previous_date, sale.total = Sale.objects.values_list(
+                'client_id', 'date', 'total'
+            ).get(pk=sale.pk)
+            sale.save(update_fields=['client', 'date', 'note'])
+            # Moving a credit sale moves its debt to the new client
+            if sale.payment_method == 'CREDIT':
+                if sale.client_id != previous_client_id:
+                    Client.adjust_balance(previous_client_id, -sale.total)
+                    Client.adjust_balance(sale.client_id, sale.total)
+                # The statement order changes from the earliest of both dates
+                if sale.client_id != previous_client_id or sale.date != previous_date:
+                    changed_since = min(previous_date, sale.date)
+                    StatementCheckpoint.invalidate(previous_client_id, changed_since)
+                    StatementCheckpoint.invalidate(sale.client_id, changed_since)
+            # Move the sale between daily rollups if its day changed
+            if timezone.localdate(sale.date) != timezone.localdate(previous_date):
+                quantities = {}
+                for product_id, quantity in sale.items.values_list('product_id', 'quantity'):
+                    quantities[product_id] = quantities.get(product_id, 0) + quantity
+                rollups.add_sale(previous_date, sale.payment_method, -sale.total, count=-1)
+                rollups.add_products(previous_date, {pid: -qty for pid, qty in quantities.items()})
+                rollups.add_sale(sale.date, sale.payment_method, sale.total)
+                rollups.add_products(sale.date, quantities)
         messages.success(request, 'Factura actualizada correctamente.')
         return redirect('invoice_detail', sale_id=sale.id)
     
-    clients = Client.objects.all()
+    prefetch_related_objects([sale], 'items__product')
     # Format date for datetime-local input
     local_date = timezone.localtime(sale.date).strftime('%Y-%m-%dT%H:%M')
-    return render(request, 'pos/edit_sale.html', {'sale': sale, 'clients': clients, 'formatted_date': local_date})
+    return render(request, 'pos/edit_sale.html', {'sale': sale, 'formatted_date': local_date})
 
 @login_required
-def search_products_for_sale(request, sale_id):
+@product_partial
+async def search_products_for_sale(request, sale_id):
     """Search products to add to a sale"""
     query = request.GET.get('search', '')
-    sale = get_object_or_404(Sale, id=sale_id)
+    if not await Sale.objects.filter(id=sale_id).aexists():
+        raise Http404
     
-    if query:
-        products = Product.objects.filter(name__icontains=query)[:10]
-    else:
-        products = []
+    products = await search.asearch_products(query, limit=10)
     
     return render(request, 'pos/partials/product_search_sale.html', {
         'products': products,
@@ -672,45 +1336,62 @@ def search_products_for_sale(request, sale_id):
         'search_query': query
     })
 
+def adjust_sale(sale, product_id, quantity, amount):
+    """
+    Apply a change of `quantity` units worth `amount` on one line of a
+    saved sale: total (F() update), stock, rollups and credit balance.
+    """
+    Sale.objects.filter(pk=sale.pk).update(total=F('total') + amount)
+    stock.move({product_id: -quantity}, StockMovement.SALE_EDIT, sale=sale)
+    rollups.add_sale(sale.date, sale.payment_method, amount, count=0)
+    rollups.add_products(sale.date, {product_id: quantity})
+    if sale.payment_method == 'CREDIT':
+        Client.adjust_balance(sale.client_id, amount)
+        StatementCheckpoint.invalidate(sale.client_id, sale.date)
+    # .update() sends no signals
+    stats_cache.invalidate_on_commit(stats_cache.SALES, stats_cache.BALANCES)
+
+def remove_sale_item(item_id):
+    """Delete a sale line and return the quantity it had (0 if already gone)"""
+    while True:
+        quantity = SaleItem.objects.filter(pk=item_id).values_list('quantity', flat=True).first()
+        if quantity is None:
+            return 0
+        # Only if no concurrent edit changed the quantity since it was read
+        if SaleItem.objects.filter(pk=item_id, quantity=quantity).delete()[0]:
+            return quantity
+
+def render_sale_items(request, sale_id):
+    items = list(SaleItem.objects.filter(sale_id=sale_id).select_related('product').order_by('id'))
+    return render(request, 'pos/partials/sale_items.html', {
+        'items': items,
+        'sale_id': sale_id,
+        'total': sum(item.subtotal for item in items),
+    })
+
+SALE_EDIT_FIELDS = ('id', 'date', 'payment_method', 'client_id')
+
 @login_required
 def add_product_to_sale(request, sale_id):
-    """Add a product to an existing sale"""
+    """Add one unit of a product to an existing sale"""
     if request.method == 'POST':
-        sale = get_object_or_404(Sale, id=sale_id)
-        product_id = request.POST.get('product_id')
-        product = get_object_or_404(Product, id=product_id)
-        
-        # Check if product already exists in sale
-        existing_item = sale.items.filter(product=product).first()
+        sale = get_object_or_404(Sale.objects.only(*SALE_EDIT_FIELDS), id=sale_id)
+        product = get_object_or_404(Product.objects.only('id', 'price'), id=request.POST.get('product_id'))
         
-        if existing_item:
-            # Increment quantity
-            existing_item.quantity += 1
-            existing_item.save()
-        else:
-            # Create new item
-            SaleItem.objects.create(
-                sale=sale,
-                product=product,
-                quantity=1,
-                price=product.price
-            )
-        
-        # Update stock
-        product.stock -= 1
-        product.save()
-        
-        # Recalculate total
-        sale.total = sum(item.subtotal for item in sale.items.all())
-        sale.save()
+        with transaction.atomic():
+            # Locked so two adds of the same product can't both find no line and insert one each
+            Sale.lock(sale.pk)
+            # A product already on the invoice gets one more unit at its sold price
+            line = SaleItem.objects.filter(sale=sale, product=product).values_list('id', 'price').first()
+            if line:
+                item_id, price = line
+                SaleItem.objects.filter(pk=item_id).update(quantity=F('quantity') + 1)
+            else:
+                price = product.price
+                SaleItem.objects.create(sale=sale, product=product, quantity=1, price=price)
+            adjust_sale(sale, product.id, 1, price)
         
-        # Return updated items list
-        items = sale.items.all()
-        return render(request, 'pos/partials/sale_items.html', {
-            'items': items,
-            'sale_id': sale_id,
-            'total': sale.total
-        })
+        return render_sale_items(request, sale_id)
     
     return HttpResponse(status=400)
 
@@ -718,49 +1399,31 @@ def add_product_to_sale(request, sale_id):
 def update_sale_item(request, sale_id, item_id):
     """Update quantity or remove a sale item"""
     if request.method == 'POST':
-        sale = get_object_or_404(Sale, id=sale_id)
-        item = get_object_or_404(SaleItem, id=item_id, sale=sale)
+        sale = get_object_or_404(Sale.objects.only(*SALE_EDIT_FIELDS), id=sale_id)
         action = request.POST.get('action')
         
-        if action == 'increment':
-            # Increase quantity
-            item.quantity += 1
-            item.save()
-            # Decrease stock
-            item.product.stock -= 1
-            item.product.save()
+        with transaction.atomic():
+            Sale.lock(sale.pk)
+            line = SaleItem.objects.filter(id=item_id, sale=sale).values_list('product_id', 'price').first()
+            if line is None:
+                raise Http404
+            product_id, price = line
+            change = 0
             
-        elif action == 'decrement':
-            if item.quantity > 1:
-                # Decrease quantity
-                item.quantity -= 1
-                item.save()
-                # Increase stock
-                item.product.stock += 1
-                item.product.save()
-            else:
-                # Remove item if quantity would be 0
-                item.product.stock += item.quantity
-                item.product.save()
-                item.delete()
-                
-        elif action == 'remove':
-            # Return stock
-            item.product.stock += item.quantity
-            item.product.save()
-            # Delete item
-            item.delete()
-        
-        # Recalculate total
-        sale.total = sum(i.subtotal for i in sale.items.all())
-        sale.save()
+            if action == 'increment':
+                change = SaleItem.objects.filter(pk=item_id).update(quantity=F('quantity') + 1)
+            elif action == 'decrement':
+                # The last unit removes the line
+                if SaleItem.objects.filter(pk=item_id, quantity__gt=1).update(quantity=F('quantity') - 1):
+                    change = -1
+                else:
+                    change = -remove_sale_item(item_id)
+            elif action == 'remove':
+                change = -remove_sale_item(item_id)
+            
+            if change:
+                adjust_sale(sale, product_id, change, change * price)
         
-        # Return updated items list
-        items = sale.items.all()
-        return render(request, 'pos/partials/sale_items.html', {
-            'items': items,
-            'sale_id': sale_id,
-            'total': sale.total
-        })
+        return render_sale_items(request, sale_id)
     
     return HttpResponse(status=400)
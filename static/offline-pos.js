@@ -0,0 +1,226 @@
+// Offline register: sells from the last catalog snapshot and queues the sales
+// in IndexedDB until the connection comes back, then sends them to /pos/sync/.
+// Every queued sale carries a uuid generated here, so re-sending is harmless.
+(function () {
+    const DB_NAME = 'fleasodapos';
+    const STORE = 'pending_sales';
+    const CATALOG_KEY = 'fleasodapos-catalog';
+    const CLIENTS_KEY = 'fleasodapos-clients';
+
+    function openDb() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => request.result.createObjectStore(STORE, { keyPath: 'uuid' });
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function withStore(mode, fn) {
+        const db = await openDb();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(STORE, mode);
+            const result = fn(tx.objectStore(STORE));
+            tx.oncomplete = () => resolve(result.result !== undefined ? result.result : result);
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+
+    const queue = {
+        add: (sale) => withStore('readwrite', (store) => store.put(sale)),
+        all: () => withStore('readonly', (store) => store.getAll()),
+        remove: (uuids) => withStore('readwrite', (store) => {
+            uuids.forEach((uuid) => store.delete(uuid));
+            return {};
+        }),
+    };
+
+    function csrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    function normalize(text) {
+        return (text || '').normalize('NFD').replace(/[\u0300-\u036f]/g, '').toLowerCase();
+    }
+
+    async function fetchJson(url) {
+        const response = await fetch(url, { credentials: 'same-origin' });
+        // An expired session answers with the login page
+        if (!response.ok || !(response.headers.get('Content-Type') || '').includes('json')) {
+            throw new Error(`${url}: ${response.status}`);
+        }
+        return response.json();
+    }
+
+    function loadStored(key) {
+        try {
+            return JSON.parse(localStorage.getItem(key));
+        } catch (e) {
+            return null;
+        }
+    }
+
+    // Brings the copy of a feed (catalog.json, clients.json) kept in
+    // localStorage up to date: online, only the rows changed since its
+    // version are downloaded (?since=N). Returns the rows as objects.
+    async function loadFeed(url, storageKey, key) {
+        const stored = loadStored(storageKey);
+        const rows = stored && Array.isArray(stored[key]) ? stored[key] : [];
+        const byId = new Map(rows.map((row) => [row.id, row]));
+        const data = await fetchJson(stored && stored.version !== undefined ? `${url}?since=${stored.version}` : url);
+        if (data.since === undefined) byId.clear(); // full snapshot
+        for (const row of data[key]) {
+            const item = Object.fromEntries(data.fields.map((field, i) => [field, row[i]]));
+            byId.set(item.id, item);
+        }
+        (data.deleted || []).forEach((id) => byId.delete(id));
+        const items = [...byId.values()];
+        localStorage.setItem(storageKey, JSON.stringify({ version: data.version, [key]: items }));
+        return items;
+    }
+
+    window.offlinePos = function (catalogUrl, clientsUrl, syncUrl) {
+        return {
+            offline: !navigator.onLine,
+            products: [],
+            clients: [],
+            query: '',
+            cart: {},
+            clientId: '',
+            paymentMethod: 'CASH',
+            note: '',
+            pending: 0,
+            rejected: [],
+            syncing: false,
+
+            async init() {
+                window.addEventListener('offline', () => { this.offline = true; });
+                window.addEventListener('online', () => { this.offline = false; this.sync(); });
+                await this.loadCatalog();
+                await this.refreshQueue();
+                if (!this.offline) this.sync();
+            },
+
+            async loadCatalog() {
+                // Products and clients from their last copies, updated with the
+                // changes since (see loadFeed); offline, the copies as they are
+                const byName = (a, b) => a.name.localeCompare(b.name);
+                try {
+                    this.products = await loadFeed(catalogUrl, CATALOG_KEY, 'products');
+                    this.clients = (await loadFeed(clientsUrl, CLIENTS_KEY, 'clients')).sort(byName);
+                } catch (e) {
+                    console.log('Usando el catálogo guardado', e);
+                    this.products = (loadStored(CATALOG_KEY) || {}).products || [];
+                    this.clients = ((loadStored(CLIENTS_KEY) || {}).clients || []).sort(byName);
+                }
+            },
+
+            async refreshQueue() {
+                const sales = await queue.all();
+                this.pending = sales.filter((sale) => !sale.error).length;
+                this.rejected = sales.filter((sale) => sale.error);
+            },
+
+            get results() {
+                const query = normalize(this.query.trim());
+                if (!query) return [];
+                const exact = this.products.filter((p) => p.barcode === this.query.trim());
+                const terms = query.split(/\s+/);
+                const matches = this.products.filter((p) => {
+                    const name = normalize(p.name);
+                    return terms.every((term) => name.includes(term));
+                });
+                return [...new Set([...exact, ...matches])].slice(0, 20);
+            },
+
+            get lines() {
+                return Object.entries(this.cart)
+                    .map(([id, quantity]) => [this.products.find((p) => p.id === Number(id)), quantity])
+                    .filter(([product]) => product)
+                    .map(([product, quantity]) => ({ ...product, quantity, subtotal: product.price * quantity }));
+            },
+
+            get total() {
+                return this.lines.reduce((sum, line) => sum + line.subtotal, 0);
+            },
+
+            add(product, quantity = 1) {
+                const current = this.cart[product.id] || 0;
+                if (current + quantity < 1) {
+                    delete this.cart[product.id];
+                } else {
+                    this.cart[product.id] = current + quantity;
+                }
+                this.cart = { ...this.cart };
+            },
+
+            scan() {
+                // Enter with an exact barcode adds it straight away, like the online scanner
+                const exact = this.products.find((p) => p.barcode === this.query.trim());
+                if (exact) {
+                    this.add(exact);
+                    this.query = '';
+                }
+            },
+
+            async checkout() {
+                if (!this.clientId || !Object.keys(this.cart).length) return;
+                await queue.add({
+                    uuid: crypto.randomUUID(),
+                    client_id: Number(this.clientId),
+                    payment_method: this.paymentMethod,
+                    date: new Date().toISOString(),
+                    note: this.note,
+                    items: Object.entries(this.cart).map(([id, quantity]) => ({ product_id: Number(id), quantity })),
+                });
+                this.cart = {};
+                this.note = '';
+                await this.refreshQueue();
+                if (!this.offline) this.sync();
+            },
+
+            async sync() {
+                if (this.syncing) return;
+                // The server takes up to 500 sales per request; the rest go on the next sync
+                const sales = (await queue.all()).filter((sale) => !sale.error).slice(0, 500);
+                if (!sales.length) return;
+                this.syncing = true;
+                try {
+                    const response = await fetch(syncUrl, {
+                        method: 'POST',
+                        credentials: 'same-origin',
+                        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken() },
+                        body: JSON.stringify({ sales }),
+                    });
+                    // An expired session answers with the login page: keep everything queued
+                    if (!response.ok || !(response.headers.get('Content-Type') || '').includes('json')) return;
+                    const { results } = await response.json();
+                    // One result per sent sale, in the same order
+                    const done = [];
+                    for (const [i, sale] of sales.entries()) {
+                        const result = results[i];
+                        if (!result) continue;
+                        if (result.status === 'rejected') {
+                            await queue.add({ ...sale, error: result.error });
+                        } else {
+                            done.push(sale.uuid);
+                        }
+                    }
+                    await queue.remove(done);
+                    if (done.length) this.loadCatalog(); // stock changed
+                } catch (e) {
+                    console.log('Sincronización pendiente', e);
+                } finally {
+                    this.syncing = false;
+                    await this.refreshQueue();
+                }
+            },
+
+            async discardRejected() {
+                await queue.remove(this.rejected.map((sale) => sale.uuid));
+                await this.refreshQueue();
+            },
+        };
+    };
+})();
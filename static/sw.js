@@ -1,13 +1,19 @@
-const CACHE_NAME = 'fleasodapos-v1';
+const CACHE_NAME = 'fleasodapos-v3';
 const ASSETS = [
     '/',
     '/static/logo.png',
     '/static/src/styles.css',
+    '/static/offline-pos.js',
     'https://cdn.tailwindcss.com',
     'https://unpkg.com/htmx.org@1.9.10',
     '//unpkg.com/alpinejs'
 ];
 
+// The register page is refreshed on every successful visit, so it opens
+// offline with the last copy it saw (the catalog itself is kept by
+// offline-pos.js in localStorage and updated with deltas)
+const OFFLINE_PATHS = ['/pos/'];
+
 self.addEventListener('install', (event) => {
     event.waitUntil(
         caches.open(CACHE_NAME)
@@ -15,9 +21,35 @@ self.addEventListener('install', (event) => {
     );
 });
 
+self.addEventListener('activate', (event) => {
+    event.waitUntil(
+        caches.keys().then((keys) => Promise.all(
+            keys.filter((key) => key !== CACHE_NAME).map((key) => caches.delete(key))
+        ))
+    );
+});
+
+function shouldStore(request) {
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return false;
+    return OFFLINE_PATHS.includes(url.pathname) || url.pathname.startsWith('/static/');
+}
+
 self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    // Checkouts and syncs always go to the network
+    if (request.method !== 'GET') return;
+
     event.respondWith(
-        fetch(event.request)
-            .catch(() => caches.match(event.request))
+        fetch(request)
+            .then((response) => {
+                // Redirects here mean the session expired (login page), don't keep those
+                if (response.ok && !response.redirected && shouldStore(request)) {
+                    const copy = response.clone();
+                    caches.open(CACHE_NAME).then((cache) => cache.put(request, copy));
+                }
+                return response;
+            })
+            .catch(() => caches.match(request, { ignoreSearch: request.mode === 'navigate' }))
     );
 });